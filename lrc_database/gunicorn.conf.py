@@ -0,0 +1,24 @@
+"""
+Gunicorn settings, read automatically when gunicorn is started from this directory.
+
+LRC_DATABASE_SERVER chooses how the app is served:
+ - wsgi (the default): each worker process handles one request at a time.
+ - asgi: each worker process runs an event loop under uvicorn, so while one request waits on the database, the worker
+   can get on with others. The async views (like the calendar feeds) benefit the most.
+"""
+
+import multiprocessing
+import os
+
+bind = "0.0.0.0:8000"
+
+server = os.getenv("LRC_DATABASE_SERVER", "wsgi")
+if server == "wsgi":
+    wsgi_app = "lrc_database.wsgi:application"
+elif server == "asgi":
+    wsgi_app = "lrc_database.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    raise ValueError("LRC_DATABASE_SERVER must be wsgi or asgi.")
+
+workers = int(os.getenv("LRC_DATABASE_WORKERS", multiprocessing.cpu_count() * 2 + 1))
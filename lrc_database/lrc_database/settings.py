@@ -15,6 +15,9 @@ from pathlib import Path
 from typing import List
 
 from django.contrib import messages
+from django.core.exceptions import ImproperlyConfigured
+
+from .database_profiles import PROFILES, postgresql_database, sqlite_database
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -53,6 +56,13 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Measures SQL and template time for every request, reports it in a Server-Timing header, and logs requests that are
+# slower than SLOW_REQUEST_THRESHOLD_MS milliseconds. See main/middleware.py.
+if os.getenv("LRC_DATABASE_INSTRUMENTATION") == "1":
+    MIDDLEWARE.insert(0, "main.middleware.InstrumentationMiddleware")
+
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("LRC_DATABASE_SLOW_REQUEST_THRESHOLD_MS", "500"))
+
 ROOT_URLCONF = "lrc_database.urls"
 
 TEMPLATES = [
@@ -66,7 +76,6 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
-                "main.context_processors.alert_counts",
             ],
         },
     },
@@ -78,13 +87,83 @@ WSGI_APPLICATION = "lrc_database.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# See database_profiles.py for what each profile does, and how to use PostgreSQL instead of SQLite. Deployments with
+# more than one worker process should use the production profile.
+DATABASE_PROFILE = os.getenv("LRC_DATABASE_PROFILE", "development")
+
+if DATABASE_PROFILE not in PROFILES:
+    raise ImproperlyConfigured(f"LRC_DATABASE_PROFILE must be one of: {', '.join(PROFILES)}.")
+
+if os.getenv("LRC_DATABASE_URL"):
+    DATABASES = {
+        "default": postgresql_database(
+            os.environ["LRC_DATABASE_URL"],
+            DATABASE_PROFILE,
+            transaction_pooling=os.getenv("LRC_DATABASE_TRANSACTION_POOLING") == "1",
+        ),
+    }
+    INSTALLED_APPS.append("django.contrib.postgres")
+else:
+    DATABASES = {
+        "default": sqlite_database(os.getenv("LRC_DATABASE_PATH", BASE_DIR / "db.sqlite3"), DATABASE_PROFILE),
+    }
+
+# How long (in seconds) connections are kept open between requests comes from the profile, but can be set with
+# LRC_DATABASE_CONN_MAX_AGE. Under ASGI it defaults to 0, so each request opens its own connection. That's because
+# Django 4.2 only closes old connections at the start and end of a request, in whichever thread the request ran in, so
+# connections opened by async views' worker threads can be left open and pile up. Opening a connection costs a few
+# milliseconds (PgBouncer keeps PostgreSQL's own connections open, so those are cheap too). Deployments with a fixed
+# number of threads can set LRC_DATABASE_CONN_MAX_AGE to keep them.
+if os.getenv("LRC_DATABASE_CONN_MAX_AGE"):
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ["LRC_DATABASE_CONN_MAX_AGE"])
+elif os.getenv("LRC_DATABASE_SERVER") == "asgi":
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+
+SQLITE_PRAGMAS = PROFILES[DATABASE_PROFILE]["PRAGMAS"]
+
+
+# Caching
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# The local-memory cache is private to each worker process, so changes seen by one worker aren't seen by the others.
+# Deployments with more than one worker should set LRC_DATABASE_CACHE_DIR to a directory that all of them share.
+if os.getenv("LRC_DATABASE_CACHE_DIR"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.getenv("LRC_DATABASE_CACHE_DIR"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
     }
+
+# Where sessions are kept, chosen with LRC_DATABASE_SESSIONS:
+#  - db (the default) reads the session from the database on every request.
+#  - cached_db reads it from the cache when it can, and writes it to both.
+#  - cache keeps it only in the cache, so it's lost when the cache is cleared. Like cached_db, it needs a cache shared by
+#    all workers (see above), or each worker would have its own sessions.
+SESSION_ENGINES = {
+    "db": "django.contrib.sessions.backends.db",
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "cache": "django.contrib.sessions.backends.cache",
 }
 
+SESSIONS = os.getenv("LRC_DATABASE_SESSIONS", "db")
+
+if SESSIONS not in SESSION_ENGINES:
+    raise ImproperlyConfigured(f"LRC_DATABASE_SESSIONS must be one of: {', '.join(SESSION_ENGINES)}.")
+
+SESSION_ENGINE = SESSION_ENGINES[SESSIONS]
+
+# Whether to cache users' group memberships across requests. They're always cached for the duration of a single
+# request. Only turn this on with a cache that is shared by all workers (see above), or workers may act on stale
+# memberships after a user's groups change.
+GROUP_MEMBERSHIP_CACHE = os.getenv("LRC_DATABASE_CACHE_GROUP_MEMBERSHIP") == "1"
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -125,6 +204,17 @@ USE_TZ = True
 
 STATIC_URL = "/static/"
 
+# Where collectstatic puts the static files for nginx to serve. When it's set, pages refer to static files by
+# content-hashed names from a manifest that collectstatic writes, so collectstatic must be run before the app starts.
+# Third-party files are downloaded into main/static/vendor by manage.py vendorstatic. See main/storage.py.
+STATIC_ROOT = os.getenv("LRC_DATABASE_STATIC_ROOT")
+
+if STATIC_ROOT:
+    STORAGES = {
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {"BACKEND": "main.storage.CompressedManifestStaticFilesStorage"},
+    }
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -1,7 +1,18 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
 
-from .models import Course, Hardware, Loan, LRCDatabaseUser, Shift, ShiftChangeRequest
+from .approvals import approve_change_requests
+from .conflicts import find_change_request_conflicts
+from .models import (
+    Course,
+    Hardware,
+    Loan,
+    LRCDatabaseUser,
+    RecurringShift,
+    RecurringShiftException,
+    Shift,
+    ShiftChangeRequest,
+)
 
 
 @admin.register(Course)
@@ -22,6 +33,27 @@ class ShiftAdmin(admin.ModelAdmin):
         "duration",
         "location",
     )
+    readonly_fields = ("end",)
+
+
+class RecurringShiftExceptionInline(admin.TabularInline):
+    model = RecurringShiftException
+    extra = 0
+
+
+@admin.register(RecurringShift)
+class RecurringShiftAdmin(admin.ModelAdmin):
+    inlines = (RecurringShiftExceptionInline,)
+    list_display = (
+        "associated_person",
+        "weekday",
+        "start_time",
+        "duration",
+        "location",
+        "first_date",
+        "last_date",
+    )
+    list_select_related = ("associated_person",)
 
 
 @admin.register(ShiftChangeRequest)
@@ -59,12 +91,47 @@ class ShiftChangeRequestAdmin(admin.ModelAdmin):
         "approved_on",
     )
 
+    actions = ("approve",)
+
+    @admin.action(description="Approve selected change requests and apply them to their shifts")
+    def approve(self, request, queryset):
+        result = approve_change_requests(queryset.values_list("id", flat=True), request.user)
+        self.message_user(request, f"Approved {len(result.approved_ids)} change requests.", messages.SUCCESS)
+        if result.skipped_ids:
+            self.message_user(
+                request,
+                "These change requests weren't approved, because an earlier request for the same shift was: "
+                + "; ".join(result.skipped),
+                messages.WARNING,
+            )
+        if result.conflicts:
+            self.message_user(
+                request, "The approved changes caused conflicts: " + "; ".join(result.conflicts), messages.WARNING
+            )
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if obj.approved:
+            conflicts = find_change_request_conflicts(obj)
+            if conflicts:
+                self.message_user(
+                    request,
+                    "This change conflicts with: " + "; ".join(map(str, conflicts)),
+                    messages.WARNING,
+                )
+
 
 @admin.register(Hardware)
 class HardwareAdmin(admin.ModelAdmin):
     list_display = ("name", "is_available")
-    ordering = ("name", "is_available")
-    list_editable = ("is_available",)
+    ordering = ("name",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_availability()
+
+    @admin.display(boolean=True, ordering="is_available")
+    def is_available(self, hardware):
+        return hardware.is_available
 
 
 @admin.register(Loan)
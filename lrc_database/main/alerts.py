@@ -0,0 +1,38 @@
+"""
+Counts of things that need attention from office staff, shown in the navbar.
+"""
+
+from typing import Dict
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .caching import bump_version, get_version
+from .models import ShiftChangeRequest
+
+ALERT_COUNTS_VERSION = "alert-counts"
+
+# Receivers bump ALERT_COUNTS_VERSION as soon as a request or shift changes, but the cache may be local to each worker
+# process, so counts are also recomputed at least this often (in seconds).
+ALERT_COUNTS_TIMEOUT = 60
+
+
+def get_pending_change_counts() -> Dict[str, int]:
+    """
+    Returns the number of pending (unapproved) shift change requests for each kind of shift, keyed by "SI" and
+    "Tutoring".
+    """
+
+    key = f"pending-change-counts:{get_version(ALERT_COUNTS_VERSION)}"
+    counts = cache.get(key)
+    if counts is None:
+        counts = ShiftChangeRequest.objects.filter(approved=False).aggregate(
+            SI=Count("id", filter=Q(target__kind="SI")),
+            Tutoring=Count("id", filter=Q(target__kind="Tutoring")),
+        )
+        cache.set(key, counts, ALERT_COUNTS_TIMEOUT)
+    return counts
+
+
+def invalidate_alert_counts() -> None:
+    bump_version(ALERT_COUNTS_VERSION)
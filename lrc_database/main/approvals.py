@@ -0,0 +1,139 @@
+"""
+Approving many shift change requests at once.
+
+However many requests are approved, it takes a fixed number of queries: one to load the requests and their shifts, a
+bulk update to apply the changes to the shifts, and one UPDATE to mark the requests as approved. It all happens in one
+transaction, so either every chosen request is approved or none are. The changed shifts are then checked for conflicts
+after the transaction, a few queries for each cluster of them that are close together in time, so that approving
+changes months apart doesn't read everything in between.
+
+Only one request per shift can be approved at a time, because each was written against the shift as it was before any
+of them were applied. When several are chosen for the same shift, the one that was made first wins, and the others are
+left pending and listed in the result, so that someone can look at them again.
+"""
+
+import datetime
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Set, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .alerts import invalidate_alert_counts
+from .conflicts import find_all_conflicts
+from .coverage import refresh_tutoring_coverage
+from .models import MAX_SHIFT_DURATION, LRCDatabaseUser, Shift, ShiftChangeRequest
+from .schedules import invalidate_schedules
+
+# How many shifts are sent to the database in each UPDATE.
+BATCH_SIZE = 500
+
+# Changed shifts less than this far apart are checked for conflicts together, in one pass over the time that they
+# cover.
+CONFLICT_CLUSTER_GAP = MAX_SHIFT_DURATION
+
+
+@dataclass
+class ApprovalResult:
+    approved_ids: List[int] = field(default_factory=list)
+    # Requests that weren't approved because a request made earlier for the same shift was.
+    skipped_ids: List[int] = field(default_factory=list)
+    # Descriptions of the skipped requests, for telling the approver which ones to look at again.
+    skipped: List[str] = field(default_factory=list)
+    # Descriptions of the conflicts that the approved changes caused.
+    conflicts: List[str] = field(default_factory=list)
+
+
+def _apply(change_request: ShiftChangeRequest) -> Set[int]:
+    """
+    Applies the changes requested by change_request to its target, without saving it, and returns the IDs of the people
+    whose schedules changed.
+    """
+
+    shift = change_request.target
+    person_ids = {shift.associated_person_id}
+    if change_request.new_associated_person_id is not None:
+        shift.associated_person_id = change_request.new_associated_person_id
+    if change_request.new_start is not None:
+        shift.start = change_request.new_start
+    if change_request.new_duration is not None:
+        shift.duration = change_request.new_duration
+    if change_request.new_location:
+        shift.location = change_request.new_location
+    # bulk_update() doesn't call save(), which would normally do this.
+    shift.end = shift.start + shift.duration
+    person_ids.add(shift.associated_person_id)
+    return person_ids
+
+
+def _clusters(shifts: List[Shift]) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+    """
+    Returns the ranges of time covered by groups of shifts, where each group's shifts are less than
+    CONFLICT_CLUSTER_GAP apart.
+    """
+
+    clusters: List[Tuple[datetime.datetime, datetime.datetime]] = []
+    for shift in sorted(shifts, key=lambda shift: shift.start):
+        if clusters and shift.start <= clusters[-1][1] + CONFLICT_CLUSTER_GAP:
+            clusters[-1] = (clusters[-1][0], max(clusters[-1][1], shift.end))
+        else:
+            clusters.append((shift.start, shift.end))
+    return clusters
+
+
+def _find_conflicts(shifts: List[Shift]) -> List[str]:
+    """
+    Returns descriptions of the conflicts that involve any of shifts, found with one pass over each cluster of them.
+    """
+
+    shift_ids = {shift.id for shift in shifts}
+    # A pair of long shifts can overlap more than one cluster, so the same conflict could be found twice.
+    conflicts: Dict[str, None] = {}
+    for range_start, range_end in _clusters(shifts):
+        for first, second, reason in find_all_conflicts(range_start, range_end):
+            if first.shift_id in shift_ids or second.shift_id in shift_ids:
+                conflicts[f"{first.description} and {second.description} ({reason})"] = None
+    return list(conflicts)
+
+
+def approve_change_requests(request_ids: Iterable[int], approver: LRCDatabaseUser) -> ApprovalResult:
+    """
+    Approves the pending change requests with request_ids on behalf of approver, and applies their changes to their
+    shifts. Requests that don't exist or were already approved are ignored.
+    """
+
+    result = ApprovalResult()
+    with transaction.atomic():
+        pending = (
+            ShiftChangeRequest.objects.filter(id__in=list(request_ids), approved=False)
+            .select_related("target__associated_person")
+            .select_for_update()
+            .order_by("id")
+        )
+        winners: Dict[int, ShiftChangeRequest] = {}
+        for change_request in pending:
+            if change_request.target_id in winners:
+                result.skipped_ids.append(change_request.id)
+                result.skipped.append(f"request {change_request.id} ({change_request.target})")
+            else:
+                winners[change_request.target_id] = change_request
+        if not winners:
+            return result
+        person_ids: Set[int] = set()
+        for change_request in winners.values():
+            person_ids |= _apply(change_request)
+        shifts = [change_request.target for change_request in winners.values()]
+        Shift.objects.bulk_update(
+            shifts, ["associated_person", "start", "duration", "end", "location"], batch_size=BATCH_SIZE
+        )
+        result.approved_ids = [change_request.id for change_request in winners.values()]
+        ShiftChangeRequest.objects.filter(id__in=result.approved_ids).update(
+            approved=True, approved_by=approver, approved_on=timezone.now()
+        )
+    # Outside the transaction, so that the requests aren't locked while it looks.
+    result.conflicts = _find_conflicts(shifts)
+    # Bulk updates don't send signals, so the caches and the rollup that they would have updated are updated here.
+    invalidate_schedules(person_ids)
+    invalidate_alert_counts()
+    refresh_tutoring_coverage(person_ids)
+    return result
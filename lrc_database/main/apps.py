@@ -4,3 +4,20 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "main"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+
+        from . import signals  # noqa: F401
+        from .database import (
+            build_search_index,
+            configure_sqlite_connection,
+            create_postgresql_indexes,
+            fill_shift_ends,
+        )
+
+        connection_created.connect(configure_sqlite_connection)
+        post_migrate.connect(fill_shift_ends, sender=self)
+        post_migrate.connect(create_postgresql_indexes, sender=self)
+        post_migrate.connect(build_search_index, sender=self)
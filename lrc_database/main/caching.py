@@ -0,0 +1,36 @@
+"""
+Versioned cache keys.
+
+Instead of hunting down and deleting every cache entry that was built from some piece of data, cached values include a
+version number in their key, and that version is bumped whenever the data changes. Entries built from old data are then
+never read again and simply age out of the cache.
+"""
+
+import time
+
+from django.core.cache import cache
+
+
+def _version_key(name: str) -> str:
+    return f"version:{name}"
+
+
+def get_version(name: str) -> int:
+    """
+    Returns the current version for name.
+
+    Versions are the time (in nanoseconds) of the change that created them. If a version is evicted from the cache, it's
+    replaced by a fresh one instead of being reset, so entries built under the old version can't be mistaken as current.
+    """
+
+    return cache.get_or_set(_version_key(name), time.time_ns, timeout=None)
+
+
+def bump_version(name: str) -> int:
+    """
+    Marks everything cached under the current version of name as stale, and returns the new version.
+    """
+
+    version = time.time_ns()
+    cache.set(_version_key(name), version, timeout=None)
+    return version
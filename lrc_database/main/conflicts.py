@@ -0,0 +1,157 @@
+"""
+Finding shifts that double-book a person or a room.
+
+Two shifts conflict if they overlap in time and either belong to the same person or happen in the same location.
+Occurrences of recurring shifts count as shifts. Checking one proposed shift takes a few indexed queries (see
+ShiftQuerySet.overlapping()), however many shifts there are, and checking every shift in a range of time takes one pass
+over them.
+"""
+
+import datetime
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from django.db.models import Q
+
+from .models import Shift, ShiftChangeRequest
+from .recurrence import Occurrence, expand, recurring_shifts_between
+
+
+@dataclass
+class Conflict:
+    shift: Union[Shift, Occurrence]
+    same_person: bool = False
+    same_location: bool = False
+
+    def __str__(self):
+        reasons = []
+        if self.same_person:
+            reasons.append("same person")
+        if self.same_location:
+            reasons.append("same location")
+        return f"{self.shift} ({' and '.join(reasons)})"
+
+
+def find_conflicts(
+    person_id: int,
+    location: str,
+    start: datetime.datetime,
+    end: datetime.datetime,
+    exclude_shift_id: Optional[int] = None,
+) -> List[Conflict]:
+    """
+    Returns the shifts and occurrences that a shift for person_id in location from start up to end would conflict with,
+    leaving out the shift with exclude_shift_id (e.g. the one being changed).
+    """
+
+    overlapping = Shift.objects.overlapping(start, end).select_related("associated_person")
+    if exclude_shift_id is not None:
+        overlapping = overlapping.exclude(id=exclude_shift_id)
+    conflicts: Dict[Union[int, Tuple[int, datetime.date]], Conflict] = {}
+    # Each of these is a range scan of its own index. Combining them with OR would make the database do both anyway.
+    for shift in overlapping.filter(associated_person_id=person_id):
+        conflicts[shift.id] = Conflict(shift, same_person=True)
+    for shift in overlapping.filter(location=location):
+        conflicts.setdefault(shift.id, Conflict(shift)).same_location = True
+    recurring_shifts = (
+        recurring_shifts_between(start, end)
+        .filter(Q(associated_person_id=person_id) | Q(location=location))
+        .select_related("associated_person")
+    )
+    for occurrence in expand(recurring_shifts, start, end):
+        conflicts[(occurrence.recurring_shift.id, occurrence.date)] = Conflict(
+            occurrence,
+            same_person=occurrence.associated_person_id == person_id,
+            same_location=occurrence.location == location,
+        )
+    return sorted(conflicts.values(), key=lambda conflict: conflict.shift.start)
+
+
+def find_change_request_conflicts(change_request: ShiftChangeRequest) -> List[Conflict]:
+    """
+    Returns what the target of change_request would conflict with if the request were approved.
+    """
+
+    shift = change_request.target
+    start = change_request.new_start or shift.start
+    return find_conflicts(
+        change_request.new_associated_person_id or shift.associated_person_id,
+        change_request.new_location or shift.location,
+        start,
+        start + (change_request.new_duration or shift.duration),
+        exclude_shift_id=shift.id,
+    )
+
+
+@dataclass
+class Booking:
+    """
+    A shift or an occurrence, reduced to what's needed to find conflicts between many of them at once.
+    """
+
+    description: str
+    person_id: int
+    location: str
+    start: datetime.datetime
+    end: datetime.datetime
+    # None for occurrences of recurring shifts.
+    shift_id: Optional[int] = None
+
+
+def _bookings_between(range_start: datetime.datetime, range_end: datetime.datetime) -> List[Booking]:
+    bookings = [
+        Booking(
+            f"Shift {shift['id']}",
+            shift["associated_person_id"],
+            shift["location"],
+            shift["start"],
+            shift["end"],
+            shift_id=shift["id"],
+        )
+        for shift in Shift.objects.overlapping(range_start, range_end)
+        .values("id", "associated_person_id", "location", "start", "end")
+        .iterator()
+    ]
+    for occurrence in expand(recurring_shifts_between(range_start, range_end), range_start, range_end):
+        bookings.append(
+            Booking(
+                f"Recurring shift {occurrence.recurring_shift.id} on {occurrence.date}",
+                occurrence.associated_person_id,
+                occurrence.location,
+                occurrence.start,
+                occurrence.end,
+            )
+        )
+    return bookings
+
+
+def _sweep(bookings: List[Booking], key: str) -> Iterator[Tuple[Booking, Booking]]:
+    """
+    Yields the pairs of bookings that have the same value of key and overlap. The bookings are sorted by key and start
+    time, so each one only has to be compared with the earlier ones with the same key that haven't ended yet.
+    """
+
+    bookings = sorted(bookings, key=lambda booking: (getattr(booking, key), booking.start))
+    active: List[Booking] = []
+    for booking in bookings:
+        active = [
+            other for other in active if getattr(other, key) == getattr(booking, key) and other.end > booking.start
+        ]
+        for other in active:
+            yield other, booking
+        active.append(booking)
+
+
+def find_all_conflicts(
+    range_start: datetime.datetime, range_end: datetime.datetime
+) -> Iterator[Tuple[Booking, Booking, str]]:
+    """
+    Yields every pair of shifts or occurrences overlapping the time from range_start up to range_end that conflict,
+    along with why.
+    """
+
+    bookings = _bookings_between(range_start, range_end)
+    for first, second in _sweep(bookings, "person_id"):
+        yield first, second, "same person"
+    for first, second in _sweep(bookings, "location"):
+        yield first, second, "same location"
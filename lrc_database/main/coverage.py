@@ -0,0 +1,182 @@
+"""
+Course coverage: how many tutors and SIs each course has, and how many hours of tutoring its tutors are scheduled for
+this week.
+
+The numbers for every course come from one aggregate query, and are kept in the CourseCoverage rollup table so that the
+whole catalog can be shown with one cheap read. Signal receivers (see signals.py) refresh just the courses affected by
+a change to a shift or to who tutors or leads SI for a course. Bulk operations, which don't send signals, refresh the
+courses of the people they affect themselves. The rollup is rebuilt from scratch when a new week starts, by the
+refreshcoverage command (run regularly, see docker-compose.yml) rather than by whoever views the page first; until then,
+the page shows last week's rows labeled with their week.
+
+A tutor's hours count towards every course that they tutor, since they cover all of them during their shifts. Shifts
+count towards the week that they start in.
+"""
+
+import datetime
+from collections import defaultdict
+from typing import DefaultDict, Iterable, List, Optional, Set, Tuple
+
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Course, CourseCoverage, LRCDatabaseUser
+from .recurrence import expand, recurring_shifts_between
+
+CoursesTutored = LRCDatabaseUser.courses_tutored.through
+
+# Held while the whole rollup is being rebuilt, so that concurrent rebuilds don't repeat the same work. It expires on its
+# own in case the process holding it dies, after long enough for a rebuild of the whole catalog to finish.
+REBUILD_LOCK_KEY = "coverage:rebuild"
+REBUILD_LOCK_TIMEOUT = 10 * 60
+
+
+def current_week() -> Tuple[datetime.date, datetime.datetime, datetime.datetime]:
+    """
+    Returns the Monday of this week, and the range of times from the start of that day up to the start of the next
+    Monday.
+    """
+
+    today = timezone.localdate()
+    week_start = today - datetime.timedelta(days=today.weekday())
+    range_start = timezone.make_aware(datetime.datetime.combine(week_start, datetime.time()))
+    range_end = timezone.make_aware(datetime.datetime.combine(week_start + datetime.timedelta(days=7), datetime.time()))
+    return week_start, range_start, range_end
+
+
+def is_in_current_week(moment: Optional[datetime.datetime]) -> bool:
+    _, range_start, range_end = current_week()
+    return moment is not None and range_start <= moment < range_end
+
+
+def _occurrence_time(
+    course_ids: Optional[Set[int]], range_start: datetime.datetime, range_end: datetime.datetime
+) -> DefaultDict[int, datetime.timedelta]:
+    """
+    Returns the total length of the occurrences of recurring tutoring shifts that start in the range, for each course
+    whose tutors have them.
+    """
+
+    tutored = CoursesTutored.objects.all()
+    if course_ids is not None:
+        tutored = tutored.filter(course_id__in=course_ids)
+    courses_by_tutor: DefaultDict[int, List[int]] = defaultdict(list)
+    for tutor_id, course_id in tutored.values_list("lrcdatabaseuser_id", "course_id"):
+        courses_by_tutor[tutor_id].append(course_id)
+    recurring_shifts = recurring_shifts_between(range_start, range_end).filter(
+        kind="Tutoring", associated_person_id__in=list(courses_by_tutor)
+    )
+    time: DefaultDict[int, datetime.timedelta] = defaultdict(datetime.timedelta)
+    for occurrence in expand(recurring_shifts, range_start, range_end):
+        if occurrence.start >= range_start:
+            for course_id in courses_by_tutor[occurrence.associated_person_id]:
+                time[course_id] += occurrence.duration
+    return time
+
+
+def refresh_course_coverage(course_ids: Optional[Iterable[int]] = None) -> None:
+    """
+    Recomputes the coverage of the courses with course_ids, or of every course if course_ids is None, and stores it in
+    the rollup table.
+    """
+
+    if course_ids is not None:
+        course_ids = set(course_ids)
+        if not course_ids:
+            return
+    week_start, range_start, range_end = current_week()
+    courses = Course.objects.all()
+    if course_ids is not None:
+        courses = courses.filter(id__in=course_ids)
+    # Joining SIs as well as tutors and their shifts would count every shift once per SI, so SIs are counted separately.
+    si_count = (
+        LRCDatabaseUser.objects.filter(si_course=OuterRef("pk"))
+        .order_by()
+        .values("si_course")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    rows = courses.order_by().annotate(
+        tutor_count=Count("lrcdatabaseuser", distinct=True),
+        si_count=Coalesce(Subquery(si_count, output_field=IntegerField()), 0),
+        tutoring_time=Sum(
+            "lrcdatabaseuser__shift__duration",
+            filter=Q(
+                lrcdatabaseuser__shift__kind="Tutoring",
+                lrcdatabaseuser__shift__start__gte=range_start,
+                lrcdatabaseuser__shift__start__lt=range_end,
+            ),
+        ),
+    )
+    occurrence_time = _occurrence_time(course_ids, range_start, range_end)
+    CourseCoverage.objects.bulk_create(
+        [
+            CourseCoverage(
+                course_id=row["id"],
+                week_start=week_start,
+                tutor_count=row["tutor_count"],
+                si_count=row["si_count"],
+                tutoring_time=(row["tutoring_time"] or datetime.timedelta()) + occurrence_time[row["id"]],
+            )
+            for row in rows.values("id", "tutor_count", "si_count", "tutoring_time")
+        ],
+        update_conflicts=True,
+        unique_fields=["course"],
+        update_fields=["week_start", "tutor_count", "si_count", "tutoring_time"],
+    )
+
+
+def refresh_tutoring_coverage(person_ids: Iterable[int]) -> None:
+    """
+    Refreshes the coverage of the courses tutored by the people with person_ids, e.g. after their shifts changed.
+    """
+
+    person_ids = [person_id for person_id in person_ids if person_id is not None]
+    if person_ids:
+        refresh_course_coverage(
+            CoursesTutored.objects.filter(lrcdatabaseuser_id__in=person_ids).values_list("course_id", flat=True)
+        )
+
+
+def is_stale() -> bool:
+    """
+    Returns whether any course's coverage is missing from the rollup or is from an earlier week.
+    """
+
+    week_start, _, _ = current_week()
+    return (
+        CourseCoverage.objects.exclude(week_start=week_start).exists()
+        or Course.objects.filter(coverage__isnull=True).exists()
+    )
+
+
+def rebuild_course_coverage() -> bool:
+    """
+    Rebuilds the coverage of every course, unless a rebuild is already running elsewhere. Returns whether it rebuilt.
+    """
+
+    if not cache.add(REBUILD_LOCK_KEY, True, timeout=REBUILD_LOCK_TIMEOUT):
+        return False
+    try:
+        refresh_course_coverage()
+    finally:
+        cache.delete(REBUILD_LOCK_KEY)
+    return True
+
+
+def get_course_coverage() -> List[CourseCoverage]:
+    """
+    Returns the coverage of every course, sorted by department and number.
+
+    Rows from an earlier week are returned as they are, since rebuilding them all would hold up the request; each row
+    says which week it's for. Only if the rollup is empty (e.g. on a new database) is it built here, by one request at a
+    time.
+    """
+
+    rollup = CourseCoverage.objects.select_related("course").order_by("course__department", "course__number")
+    coverage = list(rollup)
+    if not coverage and rebuild_course_coverage():
+        coverage = list(rollup.all())
+    return coverage
@@ -0,0 +1,66 @@
+"""
+Database-specific setup.
+"""
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+
+from .models import Shift
+from .search import rebuild_search_index
+
+
+def configure_sqlite_connection(sender, connection, **kwargs) -> None:
+    """
+    Applies settings.SQLITE_PRAGMAS to a new SQLite connection. Connected to the connection_created signal in
+    MainConfig.ready().
+    """
+
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            # Pragmas can't take parameters, but the names and values come from settings rather than from users.
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def create_postgresql_indexes(sender, using, **kwargs) -> None:
+    """
+    Creates GiST indexes over the time that each shift covers, so that ShiftQuerySet.overlapping() can find the shifts
+    that overlap a range of time for a person or a location with one index scan, however long the shifts are. Django
+    can't declare these in a model's Meta without making them PostgreSQL-only, so they're created after each migrate
+    instead. Connected to the post_migrate signal in MainConfig.ready().
+    """
+
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return
+    table = connection.ops.quote_name(Shift._meta.db_table)
+    with connection.cursor() as cursor:
+        # Lets a GiST index include plain columns, like the person, along with the range.
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        for name, column in (
+            ("shift_person_period_idx", "associated_person_id"),
+            ("shift_location_period_idx", "location"),
+        ):
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gist ({column}, tstzrange(start, "end"))'
+            )
+
+
+def build_search_index(sender, using, **kwargs) -> None:
+    """
+    Creates the search index if it doesn't exist yet, and rebuilds it from scratch, which also catches anything that was
+    written without sending signals. Connected to the post_migrate signal (which flush sends too) in MainConfig.ready().
+    """
+
+    rebuild_search_index(using)
+
+
+def fill_shift_ends(sender, using, **kwargs) -> None:
+    """
+    Sets the end of every shift that doesn't have one, such as shifts from before the column was added. Connected to the
+    post_migrate signal in MainConfig.ready().
+    """
+
+    Shift.objects.using(using).filter(end__isnull=True).update(end=F("start") + F("duration"))
@@ -1,7 +1,12 @@
+import codecs
+import io
+from typing import Iterable
+
 from django import forms
 from django.contrib.auth.models import Group
 
 from .models import Course, Hardware, Loan, LRCDatabaseUser, ShiftChangeRequest
+from .payroll import MAX_REPORT_DAYS, PERIOD_CHOICES
 
 
 class CourseForm(forms.ModelForm):
@@ -19,7 +24,46 @@ class CreateUserForm(forms.ModelForm):
 
 
 class CreateUsersInBulkForm(forms.Form):
-    user_data = forms.CharField(widget=forms.Textarea)
+    user_data = forms.CharField(widget=forms.Textarea, required=False)
+    user_file = forms.FileField(
+        required=False,
+        label="CSV file",
+        help_text="Instead of writing user data above, you can upload a CSV file with the same columns.",
+    )
+
+    def clean_user_file(self):
+        user_file = self.cleaned_data["user_file"]
+        if user_file:
+            # Files are decoded as they're imported, so check the whole file first, a chunk at a time, rather than
+            # finding out part way through the import.
+            decoder = codecs.getincrementaldecoder("utf-8-sig")()
+            try:
+                for chunk in user_file.chunks():
+                    decoder.decode(chunk)
+                decoder.decode(b"", final=True)
+            except UnicodeDecodeError:
+                raise forms.ValidationError(
+                    'This file isn\'t UTF-8 text. Save it as "CSV UTF-8" (in Excel) and upload it again.'
+                )
+            finally:
+                user_file.seek(0)
+        return user_file
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get("user_data") and not cleaned_data.get("user_file"):
+            raise forms.ValidationError("Either write user data or upload a CSV file.")
+        return cleaned_data
+
+    def get_lines(self) -> Iterable[str]:
+        """
+        Returns the user data line by line. Uploaded files are read as they're iterated over rather than all at once.
+        """
+
+        user_file = self.cleaned_data["user_file"]
+        if user_file:
+            return io.TextIOWrapper(user_file.file, encoding="utf-8-sig", newline="")
+        return io.StringIO(self.cleaned_data["user_data"], newline="")
 
 
 class EditProfileForm(forms.ModelForm):
@@ -43,7 +87,7 @@ class NewChangeRequestForm(forms.ModelForm):
 class AddHardwareForm(forms.ModelForm):
     class Meta:
         model = Hardware
-        fields = ("name", "is_available")
+        fields = ("name",)
 
         widgets = {"name": forms.TextInput(attrs={"class": "form-control"})}
 
@@ -66,3 +110,22 @@ class NewLoanForm(forms.ModelForm):
     class Meta:
         model = Loan
         fields = ("target", "hardware_user", "start_time", "return_time")
+
+
+class PayrollForm(forms.Form):
+    first_date = forms.DateField(help_text="The first day to count hours for.")
+    last_date = forms.DateField(help_text="The last day to count hours for.")
+    period = forms.ChoiceField(choices=PERIOD_CHOICES, initial="week", help_text="Add up hours by this period.")
+    format = forms.ChoiceField(
+        choices=(("html", "Show on this page"), ("csv", "CSV file"), ("json", "JSON file")), initial="html"
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        first_date = cleaned_data.get("first_date")
+        last_date = cleaned_data.get("last_date")
+        if first_date and last_date and last_date < first_date:
+            raise forms.ValidationError("The last day can't be before the first day.")
+        if first_date and last_date and (last_date - first_date).days >= MAX_REPORT_DAYS:
+            raise forms.ValidationError(f"Reports can cover at most {MAX_REPORT_DAYS} days.")
+        return cleaned_data
@@ -0,0 +1,223 @@
+"""
+iCalendar (RFC 5545) subscription feeds of people's shifts.
+
+Each person has a feed at a URL containing a signed token, so calendar apps can subscribe to it without logging in. The
+token says whose feed it is and which of their feed addresses it's for (their calendar_feed_version). Bumping that
+version revokes every address handed out before, and feeds of inactive users aren't served at all. Feeds cover a window
+of time around today rather than every shift ever, and are written out an event at a time as the shifts are read.
+
+Calendar apps poll their subscriptions, usually every few minutes to every few hours. The feed's ETag and Last-Modified
+come from the person's schedule version (see main/schedules.py) and name, and what's needed to check a token is cached
+as well, so a poll for a feed that hasn't changed is answered with a 304 without any queries. The signal receivers in
+main/signals.py forget a user's cached entry when they're saved; anything that updates users in bulk has to call
+forget_feed_owners() itself.
+"""
+
+import datetime
+import hashlib
+from typing import Iterable, Iterator, Optional, Tuple
+
+from django.core import signing
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import LRCDatabaseUser, Shift
+from .recurrence import expand, recurring_shifts_between
+from .schedules import get_schedule_version
+
+FEED_TOKEN_SALT = "main.calendar_feed"
+
+# How long a user's feed version and name are cached for. Changes to the user remove them from the cache sooner.
+FEED_OWNER_TIMEOUT = 60 * 60
+
+# How far back and ahead of today feeds go.
+FEED_DAYS_BEFORE = 30
+FEED_DAYS_AFTER = 180
+
+# Lines longer than this many bytes have to be folded onto several lines.
+MAX_LINE_LENGTH = 75
+
+
+def make_feed_token(user_id: int, feed_version: int) -> str:
+    """
+    Returns the token in the URL of user_id's feed, for their current feed_version. Tokens are accepted until the user's
+    feed version is bumped. Changing SECRET_KEY revokes all of them.
+    """
+
+    return signing.dumps([user_id, feed_version], salt=FEED_TOKEN_SALT)
+
+
+def read_feed_token(token: str) -> Optional[Tuple[int, int]]:
+    """
+    Returns the ID of the user whose feed token is for and the feed version that it was made for, or None if it wasn't
+    made by make_feed_token().
+    """
+
+    try:
+        payload = signing.loads(token, salt=FEED_TOKEN_SALT)
+    except signing.BadSignature:
+        return None
+    # Tokens from before feeds had versions only hold the user ID, and are no longer accepted.
+    if not (isinstance(payload, list) and len(payload) == 2 and all(isinstance(part, int) for part in payload)):
+        return None
+    return payload[0], payload[1]
+
+
+def _feed_owner_key(user_id: int) -> str:
+    return f"calendar_feed_owner:{user_id}"
+
+
+def get_feed_owner(user_id: int) -> Optional[Tuple[int, str]]:
+    """
+    Returns the feed version and name of user_id, or None if they don't exist or aren't active. Active users are
+    cached, so this usually doesn't query the database.
+    """
+
+    owner = cache.get(_feed_owner_key(user_id))
+    if owner is not None:
+        return owner
+    user = (
+        LRCDatabaseUser.objects.filter(id=user_id, is_active=True)
+        .values_list("calendar_feed_version", "first_name", "last_name")
+        .first()
+    )
+    if user is None:
+        return None
+    feed_version, first_name, last_name = user
+    owner = (feed_version, f"{first_name} {last_name}")
+    cache.set(_feed_owner_key(user_id), owner, FEED_OWNER_TIMEOUT)
+    return owner
+
+
+def forget_feed_owners(user_ids: Iterable[int]) -> None:
+    cache.delete_many([_feed_owner_key(user_id) for user_id in user_ids])
+
+
+def feed_window(today: datetime.date) -> Tuple[datetime.datetime, datetime.datetime]:
+    """
+    Returns the start and end of the time covered by feeds on today.
+    """
+
+    first_day = today - datetime.timedelta(days=FEED_DAYS_BEFORE)
+    last_day = today + datetime.timedelta(days=FEED_DAYS_AFTER)
+    return (
+        timezone.make_aware(datetime.datetime.combine(first_day, datetime.time())),
+        timezone.make_aware(datetime.datetime.combine(last_day, datetime.time())),
+    )
+
+
+def feed_validators(user_id: int, name: str, today: datetime.date) -> Tuple[str, int]:
+    """
+    Returns the ETag and the Last-Modified time (as a Unix timestamp) of the feed on today of user_id, who is called
+    name, without any queries.
+
+    The window moves every day, so the start of today counts as a modification as well. The name is in the feed's title,
+    so a new name changes the ETag too.
+    """
+
+    version = get_schedule_version(user_id)
+    etag = hashlib.sha256(f"{user_id}:{version}:{today}:{name}".encode()).hexdigest()[:32]
+    start_of_today = timezone.make_aware(datetime.datetime.combine(today, datetime.time()))
+    return etag, max(version // 1_000_000_000, int(start_of_today.timestamp()))
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _fold(line: str) -> str:
+    """
+    Returns line with CRLF at the end, split onto continuation lines so that none is longer than MAX_LINE_LENGTH bytes.
+    """
+
+    encoded = line.encode()
+    if len(encoded) <= MAX_LINE_LENGTH:
+        return line + "\r\n"
+    parts = []
+    current = ""
+    # Continuation lines start with a space, which counts towards their length.
+    limit = MAX_LINE_LENGTH
+    for character in line:
+        if len((current + character).encode()) > limit:
+            parts.append(current)
+            current = ""
+            limit = MAX_LINE_LENGTH - 1
+        current += character
+    parts.append(current)
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _format_time(moment: datetime.datetime) -> str:
+    return moment.astimezone(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _event(
+    uid: str, stamp: str, start: datetime.datetime, end: datetime.datetime, kind: str, location: str, url: str
+) -> Iterator[str]:
+    yield "BEGIN:VEVENT"
+    yield f"UID:{uid}"
+    yield f"DTSTAMP:{stamp}"
+    yield f"DTSTART:{_format_time(start)}"
+    yield f"DTEND:{_format_time(end)}"
+    yield f"SUMMARY:{_escape(f'{kind} in {location}')}"
+    yield f"LOCATION:{_escape(location)}"
+    yield f"URL:{url}"
+    yield "END:VEVENT"
+
+
+def stream_feed(user_id: int, name: str, today: datetime.date, origin: str) -> Iterator[str]:
+    """
+    Yields the lines of user_id's feed on today, with links to the site at origin (like https://example.com). The
+    shifts are read with an iterator, so the whole window is never held in memory at once.
+    """
+
+    range_start, range_end = feed_window(today)
+    # Every event gets the same timestamp, so the feed doesn't change unless the schedule does.
+    stamp = _format_time(
+        datetime.datetime.fromtimestamp(feed_validators(user_id, name, today)[1], datetime.timezone.utc)
+    )
+    host = origin.split("://", 1)[-1]
+    # view_shift's URL ends with the shift ID, so it only needs to be reversed once.
+    shift_url_prefix = origin + reverse("view_shift", args=(0,)).removesuffix("0")
+    lines: Iterable[str] = (
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//UMass LRC//LRC Database//EN",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_escape(f'LRC shifts for {name}')}",
+    )
+    yield from map(_fold, lines)
+    shifts = (
+        Shift.objects.overlapping(range_start, range_end)
+        .filter(associated_person_id=user_id)
+        .order_by("start")
+        .values("id", "start", "end", "kind", "location")
+    )
+    for shift in shifts.iterator():
+        lines = _event(
+            f"shift-{shift['id']}@{host}",
+            stamp,
+            shift["start"],
+            shift["end"],
+            shift["kind"],
+            shift["location"],
+            f"{shift_url_prefix}{shift['id']}",
+        )
+        yield "".join(map(_fold, lines))
+    occurrences = expand(
+        recurring_shifts_between(range_start, range_end).filter(associated_person_id=user_id), range_start, range_end
+    )
+    for occurrence in occurrences:
+        lines = _event(
+            f"recurring-shift-{occurrence.recurring_shift.id}-{occurrence.date}@{host}",
+            stamp,
+            occurrence.start,
+            occurrence.end,
+            occurrence.kind,
+            occurrence.location,
+            origin + reverse("view_occurrence", args=(occurrence.recurring_shift.id, occurrence.date.isoformat())),
+        )
+        yield "".join(map(_fold, lines))
+    yield _fold("END:VCALENDAR")
@@ -0,0 +1,114 @@
+import multiprocessing
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+from django.db.utils import ConnectionHandler
+from django.test import override_settings
+
+from lrc_database.database_profiles import PROFILES, sqlite_database
+
+# How many rows the benchmark table starts with.
+ROW_COUNT = 10000
+
+# How many rows each read fetches, like a page of a list.
+PAGE_SIZE = 50
+
+
+def create_database(path: Path) -> None:
+    database = sqlite3.connect(path)
+    with database:
+        database.execute("CREATE TABLE benchmark_row (id INTEGER PRIMARY KEY, counter INTEGER NOT NULL, note TEXT)")
+        database.execute("CREATE TABLE benchmark_log (id INTEGER PRIMARY KEY, row_id INTEGER NOT NULL, at REAL)")
+        database.executemany(
+            "INSERT INTO benchmark_row (id, counter, note) VALUES (?, 0, ?)",
+            ((i, f"Row {i}") for i in range(ROW_COUNT)),
+        )
+    database.close()
+
+
+def run_worker(path: Path, profile: str, seconds: float, write_fraction: float, seed: int) -> Dict[str, int]:
+    """
+    Acts like a worker process handling requests as fast as it can for seconds, and returns how many reads and writes
+    it managed and how many failed because the database was locked. Every request starts and ends the way Django's
+    request handling does, so connections are reused or not according to the profile.
+    """
+
+    rng = random.Random(seed)
+    connection = ConnectionHandler({"default": sqlite_database(path, profile)})["default"]
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    deadline = time.perf_counter() + seconds
+    with override_settings(SQLITE_PRAGMAS=PROFILES[profile]["PRAGMAS"]):
+        while time.perf_counter() < deadline:
+            connection.close_if_unusable_or_obsolete()
+            row_id = rng.randrange(ROW_COUNT)
+            try:
+                with connection.cursor() as cursor:
+                    if rng.random() < write_fraction:
+                        cursor.execute("BEGIN")
+                        try:
+                            cursor.execute("UPDATE benchmark_row SET counter = counter + 1 WHERE id = %s", (row_id,))
+                            cursor.execute(
+                                "INSERT INTO benchmark_log (row_id, at) VALUES (%s, %s)", (row_id, time.time())
+                            )
+                            cursor.execute("COMMIT")
+                        except OperationalError:
+                            cursor.execute("ROLLBACK")
+                            raise
+                        counts["writes"] += 1
+                    else:
+                        cursor.execute(
+                            "SELECT id, counter, note FROM benchmark_row WHERE id >= %s ORDER BY id LIMIT %s",
+                            (row_id, PAGE_SIZE),
+                        )
+                        cursor.fetchall()
+                        counts["reads"] += 1
+            except OperationalError:
+                counts["errors"] += 1
+            connection.close_if_unusable_or_obsolete()
+    connection.close()
+    return counts
+
+
+class Command(BaseCommand):
+    """
+    Measures how many requests several worker processes can handle at once against a SQLite database set up with each
+    profile in lrc_database/database_profiles.py, and how many of them fail because the database is locked.
+    Example:
+        manage.py benchmarkdatabase --workers 4 --seconds 10 --write-fraction 0.2
+    """
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--workers", default=4, type=int, help="Number of worker processes.")
+        parser.add_argument("--seconds", default=5.0, type=float, help="How long to run each profile for.")
+        parser.add_argument(
+            "--write-fraction", default=0.2, type=float, help="Fraction of requests that write to the database."
+        )
+        parser.add_argument("--profile", action="append", choices=list(PROFILES), help="Profiles to benchmark.")
+
+    def handle(self, *args, **options):
+        # Forked workers start with Django already set up.
+        context = multiprocessing.get_context("fork")
+        for profile in options["profile"] or PROFILES:
+            with tempfile.TemporaryDirectory() as directory:
+                path = Path(directory) / "benchmark.sqlite3"
+                create_database(path)
+                with context.Pool(options["workers"]) as pool:
+                    results = pool.starmap(
+                        run_worker,
+                        [
+                            (path, profile, options["seconds"], options["write_fraction"], seed)
+                            for seed in range(options["workers"])
+                        ],
+                    )
+            totals = {key: sum(result[key] for result in results) for key in ("reads", "writes", "errors")}
+            requests_per_second = (totals["reads"] + totals["writes"]) / options["seconds"]
+            self.stdout.write(
+                f"{profile}: {requests_per_second:.0f} requests/s "
+                f"({totals['reads']} reads, {totals['writes']} writes, {totals['errors']} locked)"
+            )
@@ -1,14 +1,21 @@
+import calendar
+import datetime
+import itertools
 import random
 from collections import defaultdict
-from typing import DefaultDict
+from typing import DefaultDict, Dict, Iterable, Iterator, List, TypeVar
 
-import pytz
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import Group
 from django.core.management.base import BaseCommand
+from django.db import models, transaction
 from django.utils import timezone
 from faker import Faker
-from main.models import Course, Hardware, LRCDatabaseUser, Shift, ShiftChangeRequest
+from main.coverage import refresh_course_coverage
+from main.models import Course, Hardware, Loan, LRCDatabaseUser, RecurringShift, Shift, ShiftChangeRequest
+from main.recurrence import materialize, occurrence_dates
+from main.search import rebuild_search_index
 
 User = get_user_model()
 fake = Faker()
@@ -27,6 +34,17 @@ DEPARTMENTS = (
 
 LOCATIONS = ("ELAB", "HAS", "ILC", "LGRC", "MOR3", "TOTM")
 
+GROUP_NAMES = ("Office staff", "SIs", "Supervisors", "Tutors")
+
+HARDWARE_TYPES = (
+    "Projector",
+    "Calculator",
+    "Laptop",
+    "Power adapter",
+)
+
+M = TypeVar("M", bound=models.Model)
+
 
 def get_random_object(model):
     primary_keys = model.objects.values_list("pk", flat=True)
@@ -131,49 +149,40 @@ def create_si_course_associations():
         si.save()
 
 
-def all_of_day_in_month(year: int, month: int, weekday: int, hour: int):
-    d = timezone.datetime(year, month, 1, hour, 0, 0, tzinfo=pytz.UTC) + timezone.timedelta(days=6 - weekday)
-    ret = []
-    while d.month == month:
-        ret.append(d)
-        d += timezone.timedelta(days=7)
-    return ret
-
-
 def create_shifts():
-    print("Creating shifts...")
+    print("Creating recurring shifts...")
     users = LRCDatabaseUser.objects.all()
-    current_year = timezone.now().year
-    current_month = timezone.now().month
+    today = timezone.localdate()
+    first_date = today.replace(day=1)
+    last_date = today.replace(day=calendar.monthrange(today.year, today.month)[1])
     for user in users:
         group = user.groups.first()
         if not group or group.name not in ("SIs", "Tutors"):
             continue
         group = group.name
         location = get_random_location()
-        weekday_1 = random.randint(0, 6)
-        weekday_2 = random.randint(0, 6)
-        hour_1 = random.randint(0, 23)
-        hour_2 = random.randint(0, 23)
-        shift_times = all_of_day_in_month(current_year, current_month, weekday_1, hour_1) + all_of_day_in_month(
-            current_year, current_month, weekday_2, hour_2
-        )
         print(group)
         kind = "SI" if group == "SIs" else "Tutoring"
-        for shift_time in shift_times:
-            Shift.objects.create(
+        for _ in range(2):
+            RecurringShift.objects.create(
                 associated_person=user,
-                location=location,
-                start=shift_time,
+                weekday=random.randint(0, 6),
+                start_time=datetime.time(random.randint(0, 23)),
                 duration=timezone.timedelta(hours=1),
+                location=location,
                 kind=kind,
+                first_date=first_date,
+                last_date=last_date,
             )
 
 
 def create_shift_change_requests(request_count: int):
     print("Creating shift change requests...")
     for _ in range(request_count):
-        target = get_random_object(Shift)
+        # Only the occurrences that someone asked to change have shifts of their own.
+        recurring_shift = get_random_object(RecurringShift)
+        dates = list(occurrence_dates(recurring_shift, recurring_shift.first_date, recurring_shift.last_date))
+        target = materialize(recurring_shift, random.choice(dates))
         reason = fake.text(max_nb_chars=512)
         approved = random.random() < 0.5
         approved_by = get_random_object(LRCDatabaseUser) if approved else None
@@ -197,20 +206,288 @@ def create_shift_change_requests(request_count: int):
 
 def create_hardware(hardware_count: int):
     print("Creating hardware...")
-    HARDWARE_TYPES = (
-        "Projector",
-        "Calculator",
-        "Laptop",
-        "Power adapter",
-    )
     hardware_counts: DefaultDict[str, int] = defaultdict(int)
     for _ in range(hardware_count):
         hw_type = random.choice(HARDWARE_TYPES)
-        is_available = random.random() < 0.5
         hardware_counts[hw_type] += 1
         number = hardware_counts[hw_type]
         name = f"{hw_type} #{number}"
-        Hardware.objects.create(name=name, is_available=is_available)
+        Hardware.objects.create(name=name)
+
+
+def bulk_insert(model: type[M], objects: Iterable[M], batch_size: int) -> None:
+    """
+    Inserts objects batch_size at a time, so that only one batch has to be in memory at once.
+    """
+
+    iterator = iter(objects)
+    inserted_count = 0
+    while batch := list(itertools.islice(iterator, batch_size)):
+        model.objects.bulk_create(batch)
+        inserted_count += len(batch)
+        print(f"  {inserted_count} {model._meta.verbose_name_plural}")
+
+
+class ScaleSeeder:
+    """
+    Generates large amounts of fake data quickly. Everything is generated from a fixed seed, so the same options always
+    produce the same data, and it's written with bulk inserts instead of one object at a time.
+    """
+
+    def __init__(self, seed: int, batch_size: int):
+        self.random = random.Random(seed)
+        self.fake = Faker()
+        self.fake.seed_instance(seed)
+        self.batch_size = batch_size
+
+    def random_location(self) -> str:
+        return f"{self.random.choice(LOCATIONS)} {self.random.randint(1, 200)}"
+
+    def create_groups(self) -> Dict[str, int]:
+        print("Creating groups...")
+        for group_name in GROUP_NAMES:
+            Group.objects.get_or_create(name=group_name)
+        return dict(Group.objects.values_list("name", "id"))
+
+    def create_courses(self, course_count: int) -> List[int]:
+        print("Creating courses...")
+        bulk_insert(
+            Course,
+            (
+                Course(
+                    department=self.random.choice(DEPARTMENTS),
+                    number=self.random.randint(100, 999),
+                    name=self.fake.text(max_nb_chars=64),
+                )
+                for _ in range(course_count)
+            ),
+            self.batch_size,
+        )
+        return list(Course.objects.values_list("id", flat=True))
+
+    def create_users(self, user_count: int, group_ids: Dict[str, int], course_ids: List[int]) -> Dict[str, List[int]]:
+        """
+        Creates user_count users, each in a random group, and returns the IDs of the users in each group.
+        """
+
+        print("Creating users...")
+        # Hashing a password is slow, and every fake user has the same one anyway.
+        password = make_password("password")
+        groups = [self.random.choice(GROUP_NAMES) for _ in range(user_count)]
+
+        def generate_users() -> Iterator[LRCDatabaseUser]:
+            for i, group in enumerate(groups):
+                first_name = self.fake.first_name()
+                last_name = self.fake.last_name()
+                username = f"{first_name.lower()}{last_name.lower()}{i}"
+                yield LRCDatabaseUser(
+                    username=username,
+                    password=password,
+                    first_name=first_name,
+                    last_name=last_name,
+                    email=f"{username}@umass.edu",
+                    si_course_id=self.random.choice(course_ids) if group == "SIs" and course_ids else None,
+                )
+
+        first_new_id = (LRCDatabaseUser.objects.aggregate(models.Max("id"))["id__max"] or 0) + 1
+        bulk_insert(LRCDatabaseUser, generate_users(), self.batch_size)
+        user_ids = list(
+            LRCDatabaseUser.objects.filter(id__gte=first_new_id).order_by("id").values_list("id", flat=True)
+        )
+        users_by_group: Dict[str, List[int]] = defaultdict(list)
+        for user_id, group in zip(user_ids, groups):
+            users_by_group[group].append(user_id)
+
+        print("Creating group memberships...")
+        Membership = LRCDatabaseUser.groups.through
+        bulk_insert(
+            Membership,
+            (
+                Membership(lrcdatabaseuser_id=user_id, group_id=group_ids[group])
+                for group, group_user_ids in users_by_group.items()
+                for user_id in group_user_ids
+            ),
+            self.batch_size,
+        )
+        return users_by_group
+
+    def create_tutor_course_associations(self, tutor_ids: List[int], course_ids: List[int], courses_per_tutor: int):
+        print("Creating tutor/course associations...")
+        CoursesTutored = LRCDatabaseUser.courses_tutored.through
+        bulk_insert(
+            CoursesTutored,
+            (
+                CoursesTutored(lrcdatabaseuser_id=tutor_id, course_id=course_id)
+                for tutor_id in tutor_ids
+                for course_id in self.random.sample(course_ids, min(courses_per_tutor, len(course_ids)))
+            ),
+            self.batch_size,
+        )
+
+    def create_shifts(self, shift_count: int, users_by_group: Dict[str, List[int]]) -> None:
+        """
+        Creates shift_count one-hour shifts for random SIs and tutors, spread over the weeks around the current one.
+        """
+
+        print("Creating shifts...")
+        staff = [(user_id, "SI") for user_id in users_by_group["SIs"]] + [
+            (user_id, "Tutoring") for user_id in users_by_group["Tutors"]
+        ]
+        if not staff:
+            return
+        this_week = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        first_day = this_week - timezone.timedelta(days=this_week.weekday() + 7 * 8)
+
+        def generate_shifts() -> Iterator[Shift]:
+            for _ in range(shift_count):
+                user_id, kind = self.random.choice(staff)
+                start = first_day + timezone.timedelta(
+                    days=self.random.randrange(7 * 16), hours=self.random.randint(8, 20)
+                )
+                duration = timezone.timedelta(hours=1)
+                yield Shift(
+                    associated_person_id=user_id,
+                    location=self.random_location(),
+                    start=start,
+                    duration=duration,
+                    end=start + duration,
+                    kind=kind,
+                )
+
+        bulk_insert(Shift, generate_shifts(), self.batch_size)
+
+    def create_recurring_shifts(self, recurring_shift_count: int, users_by_group: Dict[str, List[int]]) -> None:
+        """
+        Creates recurring_shift_count weekly one-hour shifts for random SIs and tutors, each lasting for a semester that
+        started up to eight weeks ago.
+        """
+
+        print("Creating recurring shifts...")
+        staff = [(user_id, "SI") for user_id in users_by_group["SIs"]] + [
+            (user_id, "Tutoring") for user_id in users_by_group["Tutors"]
+        ]
+        if not staff:
+            return
+        today = timezone.localdate()
+
+        def generate_recurring_shifts() -> Iterator[RecurringShift]:
+            for _ in range(recurring_shift_count):
+                user_id, kind = self.random.choice(staff)
+                first_date = today - timezone.timedelta(days=self.random.randrange(7 * 8))
+                yield RecurringShift(
+                    associated_person_id=user_id,
+                    weekday=self.random.randint(0, 6),
+                    start_time=datetime.time(self.random.randint(8, 20)),
+                    duration=timezone.timedelta(hours=1),
+                    location=self.random_location(),
+                    kind=kind,
+                    first_date=first_date,
+                    last_date=first_date + timezone.timedelta(weeks=16),
+                )
+
+        bulk_insert(RecurringShift, generate_recurring_shifts(), self.batch_size)
+
+    def create_shift_change_requests(self, request_count: int, approver_ids: List[int], user_ids: List[int]) -> None:
+        print("Creating shift change requests...")
+        shift_ids = list(Shift.objects.values_list("id", flat=True))
+        if not shift_ids:
+            return
+        now = timezone.now()
+
+        def generate_requests() -> Iterator[ShiftChangeRequest]:
+            for _ in range(request_count):
+                approved = bool(approver_ids) and self.random.random() < 0.5
+                yield ShiftChangeRequest(
+                    target_id=self.random.choice(shift_ids),
+                    reason=self.fake.sentence(),
+                    approved=approved,
+                    approved_by_id=self.random.choice(approver_ids) if approved else None,
+                    approved_on=now if approved else None,
+                    new_associated_person_id=self.random.choice(user_ids) if self.random.random() < 0.25 else None,
+                    new_start=now if self.random.random() < 0.25 else None,
+                    new_duration=timezone.timedelta(hours=2) if self.random.random() < 0.25 else None,
+                    new_location=self.random_location() if self.random.random() < 0.25 else None,
+                )
+
+        bulk_insert(ShiftChangeRequest, generate_requests(), self.batch_size)
+
+    def create_hardware(self, hardware_count: int) -> None:
+        print("Creating hardware...")
+        hardware_counts: DefaultDict[str, int] = defaultdict(int)
+
+        def generate_hardware() -> Iterator[Hardware]:
+            for _ in range(hardware_count):
+                hw_type = self.random.choice(HARDWARE_TYPES)
+                hardware_counts[hw_type] += 1
+                yield Hardware(name=f"{hw_type} #{hardware_counts[hw_type]}")
+
+        bulk_insert(Hardware, generate_hardware(), self.batch_size)
+
+    def create_loans(self, loan_count: int, user_ids: List[int]) -> None:
+        """
+        Creates loan_count returned loans of random hardware, plus an active loan for about half of the items.
+        """
+
+        print("Creating loans...")
+        hardware = list(Hardware.objects.values_list("id", flat=True))
+        if not hardware or not user_ids:
+            return
+        now = timezone.now()
+
+        def generate_loans() -> Iterator[Loan]:
+            for _ in range(loan_count):
+                start_time = now - timezone.timedelta(days=self.random.randint(8, 365))
+                yield Loan(
+                    target_id=self.random.choice(hardware),
+                    hardware_user_id=self.random.choice(user_ids),
+                    start_time=start_time,
+                    return_time=start_time + timezone.timedelta(days=self.random.randint(1, 7)),
+                )
+            for hardware_id in hardware:
+                if self.random.random() < 0.5:
+                    yield Loan(
+                        target_id=hardware_id,
+                        hardware_user_id=self.random.choice(user_ids),
+                        start_time=now - timezone.timedelta(days=self.random.randint(0, 7)),
+                    )
+
+        bulk_insert(Loan, generate_loans(), self.batch_size)
+
+    def add_special_users(self, group_ids: Dict[str, int], users_by_group: Dict[str, List[int]]) -> None:
+        """
+        Puts the users made by create_special_users() in their groups, so that they get data like everyone else.
+        """
+
+        special_users = {"si": "SIs", "tutor": "Tutors", "office_staff": "Office staff", "supervisor": "Supervisors"}
+        Membership = LRCDatabaseUser.groups.through
+        for username, user_id in LRCDatabaseUser.objects.filter(username__in=special_users).values_list(
+            "username", "id"
+        ):
+            group = special_users[username]
+            Membership.objects.create(lrcdatabaseuser_id=user_id, group_id=group_ids[group])
+            users_by_group[group].append(user_id)
+
+    def seed(self, options) -> None:
+        with transaction.atomic():
+            group_ids = self.create_groups()
+            course_ids = self.create_courses(options["course_count"])
+            users_by_group = self.create_users(options["user_count"], group_ids, course_ids)
+            self.add_special_users(group_ids, users_by_group)
+            all_user_ids = [user_id for group_user_ids in users_by_group.values() for user_id in group_user_ids]
+            self.create_tutor_course_associations(users_by_group["Tutors"], course_ids, options["courses_per_tutor"])
+            self.create_shifts(options["shift_count"], users_by_group)
+            self.create_recurring_shifts(options["recurring_shift_count"], users_by_group)
+            self.create_shift_change_requests(
+                options["shift_change_request_count"],
+                users_by_group["Office staff"] + users_by_group["Supervisors"],
+                all_user_ids,
+            )
+            self.create_hardware(options["hardware_count"])
+            self.create_loans(options["loan_count"], all_user_ids)
+            # Everything above was inserted in bulk, without the signals that would have kept the rollup and the search
+            # index up to date.
+            refresh_course_coverage()
+            rebuild_search_index()
 
 
 class Command(BaseCommand):
@@ -218,6 +495,9 @@ class Command(BaseCommand):
     Sets up a database with some fake data.
     Example:
         manage.py bootstrapdatabase
+
+    With --scale, large amounts of data are generated from a fixed seed and inserted in bulk, e.g. for load testing:
+        manage.py bootstrapdatabase --scale --user-count 10000 --shift-count 1000000 --shift-change-request-count 100000
     """
 
     def add_arguments(self, parser) -> None:
@@ -229,8 +509,25 @@ class Command(BaseCommand):
         parser.add_argument("--courses-per-tutor", default=3, type=int)
         parser.add_argument("--shift-change-request-count", default=100, type=int)
         parser.add_argument("--hardware-count", default=100, type=int)
+        parser.add_argument("--scale", action="store_true", help="Generate data in bulk from a fixed seed.")
+        parser.add_argument("--seed", default=0, type=int, help="Random seed used by --scale.")
+        parser.add_argument("--shift-count", default=10000, type=int, help="Number of shifts created by --scale.")
+        parser.add_argument(
+            "--recurring-shift-count", default=1000, type=int, help="Number of recurring shifts created by --scale."
+        )
+        parser.add_argument("--loan-count", default=1000, type=int, help="Number of loans created by --scale.")
+        parser.add_argument("--batch-size", default=5000, type=int, help="Rows per INSERT when using --scale.")
 
     def handle(self, *args, **options):
+        if options["scale"]:
+            create_superuser(
+                options["superuser_username"],
+                options["superuser_password"],
+                options["superuser_email"],
+            )
+            create_special_users()
+            ScaleSeeder(options["seed"], options["batch_size"]).seed(options)
+            return
         create_hardware(options["hardware_count"])
         create_superuser(
             options["superuser_username"],
@@ -0,0 +1,34 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from main.conflicts import find_all_conflicts
+
+
+class Command(BaseCommand):
+    """
+    Lists every pair of shifts (including occurrences of recurring shifts) that double-book a person or a room between
+    two dates.
+    Example:
+        manage.py checkshiftconflicts 2022-09-06 2022-12-22
+    """
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("first_date", type=datetime.date.fromisoformat, help="The first day to check, YYYY-MM-DD.")
+        parser.add_argument("last_date", type=datetime.date.fromisoformat, help="The last day to check, YYYY-MM-DD.")
+
+    def handle(self, *args, **options):
+        if options["last_date"] < options["first_date"]:
+            raise CommandError("The last day can't be before the first day.")
+        range_start = timezone.make_aware(datetime.datetime.combine(options["first_date"], datetime.time()))
+        range_end = timezone.make_aware(
+            datetime.datetime.combine(options["last_date"] + datetime.timedelta(days=1), datetime.time())
+        )
+        conflict_count = 0
+        for first, second, reason in find_all_conflicts(range_start, range_end):
+            conflict_count += 1
+            self.stdout.write(
+                f"{first.description} ({first.start} to {first.end}) and "
+                f"{second.description} ({second.start} to {second.end}): {reason}"
+            )
+        self.stdout.write(f"Found {conflict_count} conflicts.")
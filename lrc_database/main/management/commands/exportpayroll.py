@@ -0,0 +1,32 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from main.payroll import MAX_REPORT_DAYS, PERIOD_CHOICES, hours_worked, to_csv, to_json
+
+
+class Command(BaseCommand):
+    """
+    Writes how long each person worked in each period between two dates, in the same format as the export on the hours
+    worked page, e.g. for a cron job.
+    Example:
+        manage.py exportpayroll 2022-09-01 2022-09-30 --period week --format csv > hours.csv
+    """
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("first_date", type=datetime.date.fromisoformat, help="The first day to count, YYYY-MM-DD.")
+        parser.add_argument("last_date", type=datetime.date.fromisoformat, help="The last day to count, YYYY-MM-DD.")
+        parser.add_argument(
+            "--period", default="week", choices=[value for value, _ in PERIOD_CHOICES], help="Add up hours by this."
+        )
+        parser.add_argument("--format", default="csv", choices=["csv", "json"], help="Output format.")
+
+    def handle(self, *args, **options):
+        if options["last_date"] < options["first_date"]:
+            raise CommandError("The last day can't be before the first day.")
+        if (options["last_date"] - options["first_date"]).days >= MAX_REPORT_DAYS:
+            raise CommandError(f"Reports can cover at most {MAX_REPORT_DAYS} days. Export longer spans in parts.")
+        rows = hours_worked(options["first_date"], options["last_date"], options["period"])
+        for chunk in (to_csv if options["format"] == "csv" else to_json)(rows):
+            self.stdout.write(chunk, ending="")
+        if options["format"] == "json":
+            self.stdout.write("")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.user_import import import_users
+
+
+class Command(BaseCommand):
+    """
+    Creates users from a CSV file with the same columns as the bulk user creation page, without its limit on how many
+    users one import can create. Either every user is created or, if any row has a problem, none are.
+    Example:
+        manage.py importusers new_tutors.csv
+    """
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "path",
+            help="The CSV file, with the columns username, email, first_name, last_name, primary_group, password.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["path"], encoding="utf-8-sig", newline="") as lines:
+                result = import_users(lines)
+        except OSError as error:
+            raise CommandError(f"Couldn't read {options['path']}: {error.strerror}.")
+        except UnicodeDecodeError:
+            raise CommandError(f"{options['path']} isn't UTF-8 text.")
+        if result.errors:
+            raise CommandError("No users were created:\n" + "\n".join(result.errors))
+        self.stdout.write(f"Created {result.created_count} users.")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from main.coverage import is_stale, rebuild_course_coverage
+
+
+class Command(BaseCommand):
+    """
+    Rebuilds the course coverage rollup for the current week, if it has any rows from an earlier week (or --force is
+    given). Meant to be run regularly, so that the rollup is rebuilt soon after each week starts.
+    Example:
+        manage.py refreshcoverage
+    """
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--force", action="store_true", help="Rebuild the rollup even if it's up to date.")
+
+    def handle(self, *args, **options):
+        if not options["force"] and not is_stale():
+            self.stdout.write("Course coverage is up to date.")
+        elif rebuild_course_coverage():
+            self.stdout.write("Rebuilt course coverage.")
+        else:
+            self.stdout.write("Course coverage is already being rebuilt.")
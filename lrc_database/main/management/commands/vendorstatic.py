@@ -0,0 +1,112 @@
+import base64
+import hashlib
+import urllib.request
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from django.core.management.base import BaseCommand, CommandError
+
+VENDOR_DIR = Path(__file__).resolve().parents[2] / "static" / "vendor"
+
+CDN = "https://cdn.jsdelivr.net/npm"
+
+# (Path under static/vendor, URL, Subresource Integrity hash). The hashes are the ones that base.html used to check the
+# files against when they came from the CDN. Source maps and fonts are only referred to by the other files, so they
+# never had hashes of their own.
+ASSETS: Tuple[Tuple[str, str, Optional[str]], ...] = (
+    (
+        "bootstrap/css/bootstrap.min.css",
+        f"{CDN}/bootstrap@5.1.3/dist/css/bootstrap.min.css",
+        "sha256-YvdLHPgkqJ8DVUxjjnGVlMMJtNimJ6dYkowFFvp4kKs=",
+    ),
+    ("bootstrap/css/bootstrap.min.css.map", f"{CDN}/bootstrap@5.1.3/dist/css/bootstrap.min.css.map", None),
+    (
+        "bootstrap/js/bootstrap.bundle.js",
+        f"{CDN}/bootstrap@5.1.3/dist/js/bootstrap.bundle.js",
+        "sha256-htsAUOIgN8xkootpQUzmvaCbQo6x2PNMTD7kLWI6yYQ=",
+    ),
+    ("bootstrap/js/bootstrap.bundle.js.map", f"{CDN}/bootstrap@5.1.3/dist/js/bootstrap.bundle.js.map", None),
+    (
+        "bootstrap-icons/bootstrap-icons.css",
+        f"{CDN}/bootstrap-icons@1.8.1/font/bootstrap-icons.css",
+        "sha256-rzXMaro05QBd53CZ36ctTBp3FdKN3Ow0P0gDHcjLCLw=",
+    ),
+    (
+        "bootstrap-icons/fonts/bootstrap-icons.woff2",
+        f"{CDN}/bootstrap-icons@1.8.1/font/fonts/bootstrap-icons.woff2",
+        None,
+    ),
+    (
+        "bootstrap-icons/fonts/bootstrap-icons.woff",
+        f"{CDN}/bootstrap-icons@1.8.1/font/fonts/bootstrap-icons.woff",
+        None,
+    ),
+    (
+        "fullcalendar/main.min.css",
+        f"{CDN}/fullcalendar@5.10.2/main.min.css",
+        "sha256-5veQuRbWaECuYxwap/IOE/DAwNxgm4ikX7nrgsqYp88=",
+    ),
+    (
+        "fullcalendar/main.min.js",
+        f"{CDN}/fullcalendar@5.10.2/main.min.js",
+        "sha256-YicH/8aE660iEnJtgll3vT54dJApy3XkYmqNfGVFEzA=",
+    ),
+)
+
+
+def integrity(content: bytes) -> str:
+    return "sha256-" + base64.b64encode(hashlib.sha256(content).digest()).decode()
+
+
+def find_problems() -> List[str]:
+    """
+    Returns a description of each vendored file that's missing or doesn't match its integrity hash.
+    """
+
+    problems = []
+    for path, _, expected_integrity in ASSETS:
+        destination = VENDOR_DIR / path
+        if not destination.exists():
+            problems.append(f"{path} is missing.")
+        elif expected_integrity is not None and integrity(destination.read_bytes()) != expected_integrity:
+            problems.append(f"{path} doesn't match its integrity hash.")
+    return problems
+
+
+class Command(BaseCommand):
+    """
+    Downloads the third-party CSS, JavaScript and fonts that base.html loads from the CDN into main/static/vendor, so
+    that they can be committed and served along with the rest of the static files. base.html only switches to them once
+    they're committed. Files that are already there are skipped.
+
+    With --check, nothing is downloaded. Instead, it fails if any file is missing or doesn't match its hash.
+    Example:
+        manage.py vendorstatic
+        manage.py vendorstatic --check
+    """
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--force", action="store_true", help="Download files even if they're already there.")
+        parser.add_argument("--check", action="store_true", help="Check the files instead of downloading them.")
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            problems = find_problems()
+            if problems:
+                raise CommandError(
+                    "Vendored static files are missing or changed. Run manage.py vendorstatic and commit the files in "
+                    f"main/static/vendor.\n{chr(10).join(problems)}"
+                )
+            return
+        for path, url, expected_integrity in ASSETS:
+            destination = VENDOR_DIR / path
+            if destination.exists() and not options["force"]:
+                continue
+            # The URLs are the fixed https:// ones above.
+            with urllib.request.urlopen(url) as response:  # nosec B310
+                content = response.read()
+            if expected_integrity is not None and integrity(content) != expected_integrity:
+                raise CommandError(f"{url} doesn't match its integrity hash.")
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            destination.write_bytes(content)
+            self.stdout.write(f"Downloaded {path}")
@@ -0,0 +1,67 @@
+"""
+Resolves which groups a user belongs to.
+
+A single page can ask about the same user's groups many times (view decorators, template filters, context processors),
+so the names of a user's groups are loaded once and kept on the user object for the rest of the request. If the
+GROUP_MEMBERSHIP_CACHE setting is on, they're also cached across requests under a per-user version that is bumped
+whenever the user's groups change.
+"""
+
+from typing import FrozenSet, Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import bump_version, get_version
+
+# Bumped when a group is renamed or deleted, which invalidates the cached group names of every user at once.
+ALL_GROUPS_VERSION = "groups"
+
+# Attribute that the resolved group names are stored in on the user object.
+GROUP_NAMES_ATTRIBUTE = "_group_names"
+
+
+def membership_version_name(user_id: int) -> str:
+    return f"group-membership:{user_id}"
+
+
+def _load_group_names(user) -> FrozenSet[str]:
+    if not settings.GROUP_MEMBERSHIP_CACHE:
+        return frozenset(user.groups.values_list("name", flat=True))
+    key = "group-names:{}:{}:{}".format(
+        user.pk,
+        get_version(membership_version_name(user.pk)),
+        get_version(ALL_GROUPS_VERSION),
+    )
+    group_names = cache.get(key)
+    if group_names is None:
+        group_names = frozenset(user.groups.values_list("name", flat=True))
+        cache.set(key, group_names)
+    return group_names
+
+
+def get_group_names(user) -> FrozenSet[str]:
+    """
+    Returns the names of all of the groups that user is in. Anonymous users aren't in any groups.
+    """
+
+    if not user.is_authenticated:
+        return frozenset()
+    group_names = getattr(user, GROUP_NAMES_ATTRIBUTE, None)
+    if group_names is None:
+        group_names = _load_group_names(user)
+        setattr(user, GROUP_NAMES_ATTRIBUTE, group_names)
+    return group_names
+
+
+def is_in_groups(user, *groups: str) -> bool:
+    """
+    Is the user in at least one of the given groups?
+    """
+
+    return not get_group_names(user).isdisjoint(groups)
+
+
+def invalidate_group_names(user_ids: Iterable[int]) -> None:
+    for user_id in user_ids:
+        bump_version(membership_version_name(user_id))
@@ -0,0 +1,190 @@
+"""
+Opt-in instrumentation that shows where the time goes in each request.
+
+When InstrumentationMiddleware is installed (see LRC_DATABASE_INSTRUMENTATION in settings.py), every request is
+measured: how many SQL queries it ran and how long they took, how long templates took to render, and which queries were
+run more than once. The totals are sent back in a Server-Timing header, which browsers show in their developer tools,
+and requests slower than SLOW_REQUEST_THRESHOLD_MS are logged.
+
+Only work done before the response is returned is measured, so the body of a streaming response isn't included. The
+middleware works with both sync and async views, so async views aren't moved to a thread when it's installed.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional, Union
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpRequest, HttpResponse
+from django.template.backends.django import Template
+
+log = logging.getLogger("main.performance")
+
+# How many of the most repeated queries are included when logging a slow request.
+LOGGED_DUPLICATE_QUERY_COUNT = 5
+
+
+@dataclass
+class RequestMetrics:
+    query_count: int = 0
+    sql_seconds: float = 0
+    template_seconds: float = 0
+    query_fingerprints: Counter = field(default_factory=Counter)
+    # How many templates are being rendered inside one another right now. Only the outermost render is timed, since
+    # the time of the ones inside it (like the navbar's) is already part of it.
+    render_depth: int = 0
+
+    def duplicate_queries(self) -> Counter:
+        return Counter({sql: count for sql, count in self.query_fingerprints.items() if count > 1})
+
+
+# The metrics of the request being handled in the current thread or task, if it is being measured.
+current_metrics: contextvars.ContextVar[Optional[RequestMetrics]] = contextvars.ContextVar(
+    "current_metrics", default=None
+)
+
+
+def fingerprint(sql: str) -> str:
+    """
+    Returns a normalized form of sql. Parameters are passed to the database separately, so queries that only differ in
+    their parameters have the same fingerprint.
+    """
+
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def time_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.sql_seconds += time.perf_counter() - start
+        metrics.query_count += 1
+        metrics.query_fingerprints[fingerprint(sql)] += 1
+
+
+def install_query_timer(connection, **kwargs) -> None:
+    """
+    Adds time_query() to connection's execute wrappers for good, if it isn't there already. It does nothing outside of
+    measured requests.
+
+    Connections belong to a thread, and async views run their queries in another thread than the middleware, so the
+    timer is added to each connection as it's opened (through the connection_created signal) rather than around each
+    request.
+    """
+
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+def install_template_timer() -> None:
+    """
+    Wraps the Django template backend's render method so that the time spent rendering templates is measured. Included
+    templates, and templates rendered to a string by a tag while rendering another, are part of the outer template's
+    time, so they aren't counted twice.
+    """
+
+    if getattr(Template.render, "is_timed", False):
+        return
+    untimed_render = Template.render
+
+    @functools.wraps(untimed_render)
+    def render(self, context=None, request=None):
+        metrics = current_metrics.get()
+        if metrics is None or metrics.render_depth:
+            return untimed_render(self, context, request)
+        metrics.render_depth += 1
+        start = time.perf_counter()
+        try:
+            return untimed_render(self, context, request)
+        finally:
+            metrics.template_seconds += time.perf_counter() - start
+            metrics.render_depth -= 1
+
+    render.is_timed = True  # type: ignore
+    Template.render = render  # type: ignore
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response: Callable[[HttpRequest], Union[HttpResponse, Awaitable[HttpResponse]]]) -> None:
+        self.get_response = get_response
+        install_template_timer()
+        connection_created.connect(install_query_timer)
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> Union[HttpResponse, Awaitable[HttpResponse]]:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        self.report(request, response, metrics, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        metrics = RequestMetrics()
+        # Queries made through sync_to_async() run in a copy of this context, so they see these metrics too.
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        self.report(request, response, metrics, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def report(request: HttpRequest, response: HttpResponse, metrics: RequestMetrics, total_seconds: float) -> None:
+        """
+        Adds the Server-Timing header to response, and logs the request if it was slow.
+        """
+
+        duplicate_queries = metrics.duplicate_queries()
+        response["Server-Timing"] = ", ".join(
+            (
+                f'sql;dur={metrics.sql_seconds * 1000:.1f};desc="{metrics.query_count} queries"',
+                f'dup;desc="{sum(duplicate_queries.values())} duplicate queries"',
+                f"tpl;dur={metrics.template_seconds * 1000:.1f}",
+                f"total;dur={total_seconds * 1000:.1f}",
+            )
+        )
+
+        if total_seconds * 1000 >= settings.SLOW_REQUEST_THRESHOLD_MS:
+            record = {
+                "event": "slow_request",
+                "method": request.method,
+                "path": request.path,
+                "url_name": request.resolver_match.url_name if request.resolver_match else None,
+                "status": response.status_code,
+                "total_ms": round(total_seconds * 1000, 1),
+                "sql_ms": round(metrics.sql_seconds * 1000, 1),
+                "template_ms": round(metrics.template_seconds * 1000, 1),
+                "query_count": metrics.query_count,
+                "duplicate_queries": [
+                    {"sql": sql, "count": count}
+                    for sql, count in duplicate_queries.most_common(LOGGED_DUPLICATE_QUERY_COUNT)
+                ],
+            }
+            log.warning(json.dumps(record), extra={"performance": record})
@@ -1,9 +1,33 @@
+import datetime
+
 from django.contrib.auth.models import AbstractUser
 from django.core import validators
-from django.db import models
+from django.db import connections, models
+
+SHIFT_KIND_CHOICES = (("SI", "SI"), ("Tutoring", "Tutoring"))
+
+# No shift can be longer than this. Knowing it lets a search for the shifts that overlap a range of time only look at
+# the ones that start a little before it, instead of every shift that starts before it, which makes it an index range
+# scan.
+MAX_SHIFT_DURATION = datetime.timedelta(days=1)
+
+WEEKDAY_CHOICES = (
+    (0, "Monday"),
+    (1, "Tuesday"),
+    (2, "Wednesday"),
+    (3, "Thursday"),
+    (4, "Friday"),
+    (5, "Saturday"),
+    (6, "Sunday"),
+)
 
 
 class Course(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=["department", "number", "id"], name="course_department_number_idx"),
+        ]
+
     department = models.CharField(
         max_length=16,
         help_text="Department string, like COMPSCI or MATH.",
@@ -24,7 +48,32 @@ class Course(models.Model):
         return f"{self.department} {self.number}: {self.name}"
 
 
+class CourseCoverage(models.Model):
+    """
+    How well a course is covered in the week starting on week_start: a rollup kept up to date by main.coverage, so that
+    coverage for the whole catalog can be read without counting anything.
+    """
+
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name="coverage")
+    week_start = models.DateField(help_text="The Monday of the week that the hours are for.")
+    tutor_count = models.PositiveIntegerField(default=0)
+    si_count = models.PositiveIntegerField(default=0)
+    tutoring_time = models.DurationField(
+        default=datetime.timedelta,
+        help_text="Total length of the tutoring shifts that the course's tutors have in the week.",
+    )
+
+    @property
+    def tutoring_hours(self) -> float:
+        return self.tutoring_time.total_seconds() / 3600
+
+
 class LRCDatabaseUser(AbstractUser):
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=["last_name", "id"], name="user_last_name_idx"),
+        ]
+
     courses_tutored = models.ManyToManyField(Course, blank=True, default=None)
     si_course = models.ForeignKey(
         to=Course,
@@ -35,6 +84,10 @@ class LRCDatabaseUser(AbstractUser):
         related_name="lrc_database_user_si_course",
         verbose_name="SI course",
     )
+    calendar_feed_version = models.PositiveIntegerField(
+        default=0,
+        help_text="Bumped to revoke the user's calendar feed address. Addresses made for earlier versions stop working.",
+    )
 
     def __str__(self):
         if not (self.first_name and self.last_name):
@@ -43,29 +96,213 @@ class LRCDatabaseUser(AbstractUser):
             return f"{self.first_name} {self.last_name}"
 
 
+class ShiftQuerySet(models.QuerySet):
+    def overlapping(self, start: datetime.datetime, end: datetime.datetime) -> "ShiftQuerySet":
+        """
+        Filters to the shifts that overlap the time from start up to end. Shifts that only touch it, by ending when it
+        starts or starting when it ends, don't count.
+        """
+
+        if connections[self.db].vendor == "postgresql":
+            # PostgreSQL can compare the ranges directly, using the GiST indexes made by
+            # main.database.create_postgresql_indexes(). The range types need psycopg, which SQLite doesn't.
+            from django.contrib.postgres.fields import DateTimeRangeField
+            from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+
+            period = models.Func(
+                models.F("start"), models.F("end"), function="TSTZRANGE", output_field=DateTimeRangeField()
+            )
+            return self.alias(period=period).filter(period__overlap=DateTimeTZRange(start, end))
+        return self.filter(start__gt=start - MAX_SHIFT_DURATION, start__lt=end, end__gt=start)
+
+    # Shift.end is stored, so writes that skip Shift.save() fill it in here instead.
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for shift in objs:
+            shift.end = shift.start + shift.duration
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if {"start", "duration"} & set(fields):
+            objs = list(objs)
+            for shift in objs:
+                shift.end = shift.start + shift.duration
+            fields = {*fields, "end"}
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        if {"start", "duration"} & kwargs.keys():
+            # Each side is either the new value or an expression of the row's old values, which is what the UPDATE
+            # sets start and duration to.
+            kwargs["end"] = kwargs.get("start", models.F("start")) + kwargs.get("duration", models.F("duration"))
+        return super().update(**kwargs)
+
+
 class Shift(models.Model):
+    class Meta:
+        indexes = [
+            # Someone's schedule, e.g. for their calendar or for finding double bookings.
+            models.Index(fields=["associated_person", "start", "end"], name="shift_person_start_idx"),
+            # Everything happening in a room, e.g. for finding double bookings.
+            models.Index(fields=["location", "start", "end"], name="shift_location_start_idx"),
+            # All SI or tutoring shifts in a range of time.
+            models.Index(fields=["kind", "start"], name="shift_kind_start_idx"),
+            # All shifts in a range of time, e.g. when dropping shifts on a date.
+            models.Index(fields=["start"], name="shift_start_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["recurrence", "occurrence_date"], name="shift_one_per_occurrence"),
+            models.CheckConstraint(
+                check=models.Q(duration__gt=datetime.timedelta(), duration__lte=MAX_SHIFT_DURATION),
+                name="shift_duration_range",
+            ),
+        ]
+
+    objects = ShiftQuerySet.as_manager()
+
     associated_person = models.ForeignKey(
         to=LRCDatabaseUser,
         on_delete=models.CASCADE,
         help_text="The person who is associated with this work shift.",
     )
     start = models.DateTimeField(help_text="The time that the shift starts.")
-    duration = models.DurationField(help_text="How long the shift will last, in HH:MM:SS format.")
+    duration = models.DurationField(
+        validators=[
+            validators.MinValueValidator(datetime.timedelta(minutes=1)),
+            validators.MaxValueValidator(MAX_SHIFT_DURATION),
+        ],
+        help_text="How long the shift will last, in HH:MM:SS format. Shifts can't be longer than a day.",
+    )
+    # Stored rather than computed so that it can be indexed. save() and the bulk methods of ShiftQuerySet keep it up to
+    # date. It's only nullable so that the column can be added to existing databases; fill_shift_ends() (run after
+    # every migrate) fills it in for rows from before it existed.
+    end = models.DateTimeField(null=True, editable=False, help_text="The time that the shift ends.")
     location = models.CharField(
         max_length=32,
         help_text="The location where the shift will be occur, e.g. GSMN 64.",
     )
     kind = models.CharField(
         max_length=8,
-        choices=(("SI", "SI"), ("Tutoring", "Tutoring")),
+        choices=SHIFT_KIND_CHOICES,
         help_text="The kind of shift this is.",
     )
+    recurrence = models.ForeignKey(
+        to="RecurringShift",
+        related_name="materialized_shifts",
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        default=None,
+        help_text="The recurring shift (if any) that this shift is an occurrence of.",
+    )
+    occurrence_date = models.DateField(
+        blank=True,
+        null=True,
+        default=None,
+        help_text="The date of the occurrence of the recurring shift that this shift replaces.",
+    )
 
     def __str__(self):
         return f"{self.associated_person} in {self.location} at {self.start}"
 
+    def save(self, *args, **kwargs):
+        self.end = self.start + self.duration
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"start", "duration"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "end"}
+        super().save(*args, **kwargs)
+
+
+class RecurringShift(models.Model):
+    """
+    A shift that happens every week on the same day, at the same time, between two dates. Its occurrences aren't stored
+    as rows of their own; see recurrence.py.
+    """
+
+    class Meta:
+        indexes = [
+            # Someone's schedule, e.g. for their calendar.
+            models.Index(fields=["associated_person", "first_date"], name="recurring_person_first_idx"),
+            # All recurring shifts in a range of dates, e.g. when dropping shifts on a date.
+            models.Index(fields=["first_date"], name="recurring_first_date_idx"),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(last_date__gte=models.F("first_date")), name="recurring_date_order"),
+        ]
+
+    associated_person = models.ForeignKey(
+        to=LRCDatabaseUser,
+        related_name="recurring_shifts",
+        on_delete=models.CASCADE,
+        help_text="The person who is associated with these work shifts.",
+    )
+    weekday = models.PositiveSmallIntegerField(
+        choices=WEEKDAY_CHOICES,
+        help_text="The day of the week that the shifts happen on.",
+    )
+    start_time = models.TimeField(help_text="The local time that each shift starts.")
+    duration = models.DurationField(
+        validators=[
+            validators.MinValueValidator(datetime.timedelta(minutes=1)),
+            validators.MaxValueValidator(MAX_SHIFT_DURATION),
+        ],
+        help_text="How long each shift will last, in HH:MM:SS format. Shifts can't be longer than a day.",
+    )
+    location = models.CharField(
+        max_length=32,
+        help_text="The location where the shifts will occur, e.g. GSMN 64.",
+    )
+    kind = models.CharField(
+        max_length=8,
+        choices=SHIFT_KIND_CHOICES,
+        help_text="The kind of shifts these are.",
+    )
+    first_date = models.DateField(help_text="The first day that the shifts can happen on.")
+    last_date = models.DateField(help_text="The last day that the shifts can happen on.")
+
+    def __str__(self):
+        return (
+            f"{self.associated_person} in {self.location} every {self.get_weekday_display()} at {self.start_time}, "
+            f"{self.first_date} to {self.last_date}"
+        )
+
+
+class RecurringShiftException(models.Model):
+    """
+    A day on which a recurring shift doesn't happen, either because it was cancelled or because that occurrence was
+    replaced by a Shift of its own so that it could be changed.
+    """
+
+    class Meta:
+        indexes = [
+            # All exceptions in a range of dates, e.g. when adding up hours worked.
+            models.Index(fields=["date"], name="recurring_exception_date_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["recurring_shift", "date"], name="recurring_exception_unique"),
+        ]
+
+    recurring_shift = models.ForeignKey(
+        to=RecurringShift,
+        related_name="exceptions",
+        on_delete=models.CASCADE,
+        help_text="The recurring shift that doesn't happen on this day.",
+    )
+    date = models.DateField(help_text="The day that the shift doesn't happen on.")
+
+    def __str__(self):
+        return f"{self.recurring_shift} (except {self.date})"
+
 
 class ShiftChangeRequest(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=["target", "approved"], name="request_target_approved_idx"),
+            # Pending requests are looked at all the time, but they're a small fraction of all requests ever made.
+            models.Index(fields=["target"], condition=models.Q(approved=False), name="request_pending_target_idx"),
+        ]
+
     target = models.ForeignKey(
         to=Shift,
         related_name="shift_change_request_target",
@@ -114,6 +351,10 @@ class ShiftChangeRequest(models.Model):
         blank=True,
         null=True,
         default=None,
+        validators=[
+            validators.MinValueValidator(datetime.timedelta(minutes=1)),
+            validators.MaxValueValidator(MAX_SHIFT_DURATION),
+        ],
         help_text="How long the shift will last, in HH:MM:SS format, if this request is approved.",
     )
     new_location = models.CharField(
@@ -125,18 +366,48 @@ class ShiftChangeRequest(models.Model):
     )
 
 
+class HardwareQuerySet(models.QuerySet):
+    def with_availability(self) -> "HardwareQuerySet":
+        """
+        Annotates each item with is_available, which is true unless the item has a loan that hasn't been returned yet.
+        """
+
+        active_loans = Loan.objects.filter(target=models.OuterRef("pk"), return_time__isnull=True)
+        return self.annotate(is_available=~models.Exists(active_loans))
+
+
 class Hardware(models.Model):
     class Meta:
         verbose_name_plural = "hardware"
+        indexes = [
+            models.Index(fields=["name", "id"], name="hardware_name_idx"),
+        ]
 
     name = models.CharField(max_length=200)
-    is_available = models.BooleanField(default=True)
+
+    objects = HardwareQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
 
 class Loan(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=["return_time", "id"], name="loan_return_time_idx"),
+        ]
+        constraints = [
+            # An item can only be lent to one person at a time. Active loans (the ones that haven't been returned yet)
+            # are a small fraction of all loans ever made, so the index behind this constraint is also a cheap way to
+            # find them.
+            models.UniqueConstraint(
+                fields=["target"],
+                condition=models.Q(return_time__isnull=True),
+                name="loan_one_active_per_target",
+                violation_error_message="This item is already on loan.",
+            ),
+        ]
+
     target = models.ForeignKey(
         to=Hardware,
         related_name="intended_hardware_to_borrow",
@@ -0,0 +1,75 @@
+"""
+Cached navbar fragments.
+
+The navbar depends on who the user is, which groups they're in, and (for office staff and supervisors) the alert
+counts. It's rendered once and cached under the versions of all of those, so that a page load with a cached navbar
+doesn't have to look up the user's groups or count alerts, or reverse the navbar's URLs. Each version is bumped by a
+signal receiver when what it covers changes (see signals.py), which makes the cached fragment stale.
+"""
+
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from django.core.cache import cache
+from django.utils.safestring import SafeString
+
+from .alerts import ALERT_COUNTS_VERSION, get_pending_change_counts
+from .caching import bump_version, get_version
+from .membership import ALL_GROUPS_VERSION, is_in_groups, membership_version_name
+
+# Like ALERT_COUNTS_TIMEOUT: the cache may be local to each worker process, so fragments are also re-rendered at least
+# this often (in seconds) to pick up changes made through other workers.
+NAVBAR_TIMEOUT = 60
+
+
+def navbar_version_name(user_id: int) -> str:
+    # Covers what the navbar shows about the user themself, like their name.
+    return f"navbar:{user_id}"
+
+
+def _cache_key(user) -> str:
+    return "navbar:{}:{}:{}:{}".format(
+        user.pk,
+        get_version(membership_version_name(user.pk)),
+        get_version(ALL_GROUPS_VERSION),
+        get_version(navbar_version_name(user.pk)),
+    )
+
+
+def _render(user, privileged: bool) -> SafeString:
+    # Imported here because the template engine isn't ready when models are loaded.
+    from django.template.loader import render_to_string
+
+    context: Dict[str, Any] = {"user": user, "privileged": privileged}
+    if privileged:
+        counts = get_pending_change_counts()
+        context.update(
+            pending_si_change_count=counts["SI"],
+            pending_tutoring_change_count=counts["Tutoring"],
+            total_alert_count=counts["SI"] + counts["Tutoring"],
+        )
+    return render_to_string("includes/navbar.html", context)
+
+
+def render_navbar(user) -> SafeString:
+    """
+    Returns the navbar for user, from the cache if it's still current.
+    """
+
+    if not user.is_authenticated:
+        return _render(user, False)
+    key = _cache_key(user)
+    alert_counts_version = get_version(ALERT_COUNTS_VERSION)
+    # The alert counts are only shown to privileged users, so only their fragments are stored with the version of the
+    # counts that they show. Everyone else's are stored with None and don't go stale when the counts change.
+    cached: Optional[Tuple[Optional[int], SafeString]] = cache.get(key)
+    if cached is not None and cached[0] in (None, alert_counts_version):
+        return cached[1]
+    privileged = is_in_groups(user, "Office staff", "Supervisors")
+    navbar = _render(user, privileged)
+    cache.set(key, (alert_counts_version if privileged else None, navbar), NAVBAR_TIMEOUT)
+    return navbar
+
+
+def invalidate_navbars(user_ids: Iterable[int]) -> None:
+    for user_id in user_ids:
+        bump_version(navbar_version_name(user_id))
@@ -0,0 +1,144 @@
+"""
+Keyset (or cursor) pagination.
+
+Instead of skipping over the rows of earlier pages with OFFSET, which gets slower the further into a list you go, each
+page remembers the sort key of its last row in a cursor, and the next page asks for the rows that sort after it. With an
+index on the sort key, every page costs the same no matter how long the list is.
+
+The sort key must end with a unique field (like "id"), so that every row has a distinct position in the order.
+"""
+
+import base64
+import binascii
+import functools
+import json
+import operator
+from dataclasses import dataclass
+from typing import Any, Generic, List, Optional, Sequence, TypeVar
+
+from django.core.exceptions import BadRequest, ValidationError
+from django.db import models
+from django.db.models import F, Q, QuerySet
+from django.http import HttpRequest
+
+# How many rows are shown on each page.
+PAGE_SIZE = 50
+
+M = TypeVar("M", bound=models.Model)
+
+
+@dataclass
+class KeysetPage(Generic[M]):
+    items: List[M]
+    next_cursor: Optional[str]
+
+
+def _parse_ordering(model: type[models.Model], ordering: Sequence[str]) -> List[tuple[models.Field, bool]]:
+    fields = []
+    for name in ordering:
+        descending = name.startswith("-")
+        fields.append((model._meta.get_field(name.removeprefix("-")), descending))
+    return fields
+
+
+def _order_by(field: models.Field, descending: bool):
+    """
+    Null values sort before everything else in ascending order and after everything else in descending order, no matter
+    which database is used.
+    """
+
+    if not field.null:
+        return f"-{field.name}" if descending else field.name
+    if descending:
+        return F(field.name).desc(nulls_last=True)
+    return F(field.name).asc(nulls_first=True)
+
+
+def _equal_to(field: models.Field, value: Any) -> Q:
+    if value is None:
+        return Q(**{f"{field.name}__isnull": True})
+    return Q(**{field.name: value})
+
+
+def _after(field: models.Field, value: Any, descending: bool) -> Q:
+    """
+    Returns a filter for the rows that come after value in the order of field.
+    """
+
+    if value is None:
+        if descending:
+            # Nothing comes after null values in descending order.
+            return Q(pk__in=[])
+        return Q(**{f"{field.name}__isnull": False})
+    after = Q(**{f"{field.name}__{'lt' if descending else 'gt'}": value})
+    if descending and field.null:
+        after |= Q(**{f"{field.name}__isnull": True})
+    return after
+
+
+def _encode_cursor(item: models.Model, fields: List[tuple[models.Field, bool]]) -> str:
+    values = [getattr(item, field.attname) for field, _ in fields]
+    # Dates and times are encoded with their full precision, so that the cursor compares equal to the row it came from.
+    return base64.urlsafe_b64encode(json.dumps(values, default=lambda value: value.isoformat()).encode()).decode()
+
+
+def _decode_cursor(cursor: str, fields: List[tuple[models.Field, bool]]) -> List[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError
+        return [None if value is None else field.to_python(value) for (field, _), value in zip(fields, values)]
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        raise BadRequest("Invalid cursor.")
+
+
+def _page_queryset(request: HttpRequest, queryset: QuerySet[M], fields: List[tuple[models.Field, bool]]) -> QuerySet[M]:
+    """
+    Returns the rows of queryset for the page that starts after the cursor in the request's "cursor" parameter, or the
+    first page if there isn't one, plus one more to tell whether there's a next page.
+    """
+
+    cursor = request.GET.get("cursor")
+    if cursor:
+        values = _decode_cursor(cursor, fields)
+        # A row comes after the cursor if it matches the cursor on the first i fields of the ordering, and comes after
+        # it on the next one.
+        conditions = []
+        for i, (field, descending) in enumerate(fields):
+            condition = _after(field, values[i], descending)
+            for j, (earlier_field, _) in enumerate(fields[:i]):
+                condition &= _equal_to(earlier_field, values[j])
+            conditions.append(condition)
+        queryset = queryset.filter(functools.reduce(operator.or_, conditions))
+        # Every row after the cursor is also at or after it on the first field. Saying so lets the database walk an index
+        # on the ordering from the cursor onwards, and stop after one page, instead of sorting all the rows after it.
+        field, descending = fields[0]
+        if values[0] is not None and not (descending and field.null):
+            queryset = queryset.filter(**{f"{field.name}__{'lte' if descending else 'gte'}": values[0]})
+    return queryset.order_by(*(_order_by(field, descending) for field, descending in fields))[: PAGE_SIZE + 1]
+
+
+def _make_page(items: List[M], fields: List[tuple[models.Field, bool]]) -> KeysetPage[M]:
+    if len(items) > PAGE_SIZE:
+        items = items[:PAGE_SIZE]
+        return KeysetPage(items, _encode_cursor(items[-1], fields))
+    return KeysetPage(items, None)
+
+
+def paginate(request: HttpRequest, queryset: QuerySet[M], ordering: Sequence[str]) -> KeysetPage[M]:
+    """
+    Returns the page of queryset, sorted by the fields in ordering, that starts after the cursor in the request's
+    "cursor" parameter, or the first page if there isn't one.
+    """
+
+    fields = _parse_ordering(queryset.model, ordering)
+    return _make_page(list(_page_queryset(request, queryset, fields)), fields)
+
+
+async def apaginate(request: HttpRequest, queryset: QuerySet[M], ordering: Sequence[str]) -> KeysetPage[M]:
+    """
+    Like paginate(), for async views.
+    """
+
+    fields = _parse_ordering(queryset.model, ordering)
+    return _make_page([item async for item in _page_queryset(request, queryset, fields)], fields)
@@ -0,0 +1,241 @@
+"""
+Hours worked, for payroll.
+
+Shifts are summed by person, kind and pay period (a day, week or month, by when each shift starts) inside the database,
+so only one row per person, kind and period is ever fetched, however many shifts there are. Occurrences of recurring
+shifts aren't expanded: how many times each recurring shift happens in each period is worked out from its dates, less
+its exceptions in that period, which are counted with one query. Reports are produced a row at a time, so they can be
+streamed in constant memory, and cover at most MAX_REPORT_DAYS.
+"""
+
+import csv
+import datetime
+import heapq
+import itertools
+import json
+from collections import Counter
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Tuple
+
+from asgiref.sync import sync_to_async
+from django.db.models import F, Sum
+from django.db.models.functions import ExtractIsoWeekDay, TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import RecurringShift, RecurringShiftException, Shift
+from .recurrence import occurrence_dates, recurring_shifts_between
+
+PERIOD_FUNCTIONS = {"day": TruncDay, "week": TruncWeek, "month": TruncMonth}
+
+PERIOD_CHOICES = (("day", "Day"), ("week", "Week"), ("month", "Month"))
+
+# Reports can't cover more days than this, so that one request can't read years of shifts.
+MAX_REPORT_DAYS = 366
+
+# How many chunks of a report are made at a time when it's streamed to an ASGI server.
+STREAM_BATCH_SIZE = 200
+
+# The columns of a report, in order.
+FIELDS = ("username", "first_name", "last_name", "kind", "period_start", "hours")
+
+
+@dataclass
+class HoursRow:
+    person_id: int
+    username: str
+    first_name: str
+    last_name: str
+    kind: str
+    period_start: datetime.date
+    duration: datetime.timedelta
+
+    @property
+    def hours(self) -> str:
+        return f"{self.duration.total_seconds() / 3600:.2f}"
+
+    @property
+    def key(self) -> Tuple[int, str, datetime.date]:
+        return self.person_id, self.kind, self.period_start
+
+    def as_record(self) -> List[str]:
+        return [self.username, self.first_name, self.last_name, self.kind, self.period_start.isoformat(), self.hours]
+
+
+def period_start(moment: datetime.datetime, period: str) -> datetime.date:
+    """
+    Returns the first day of the period that moment is in, in the current time zone, the same way that the database
+    truncates it.
+    """
+
+    return _period_of(timezone.localtime(moment).date(), period)
+
+
+def _period_of(day: datetime.date, period: str) -> datetime.date:
+    if period == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _shift_rows(range_start: datetime.datetime, range_end: datetime.datetime, period: str) -> Iterator[HoursRow]:
+    rows = (
+        Shift.objects.filter(start__gte=range_start, start__lt=range_end)
+        .annotate(period=PERIOD_FUNCTIONS[period]("start"))
+        .values(
+            "associated_person_id",
+            "associated_person__username",
+            "associated_person__first_name",
+            "associated_person__last_name",
+            "kind",
+            "period",
+        )
+        .annotate(duration=Sum("duration"))
+        .order_by("associated_person_id", "kind", "period")
+    )
+    for row in rows.iterator():
+        yield HoursRow(
+            row["associated_person_id"],
+            row["associated_person__username"],
+            row["associated_person__first_name"],
+            row["associated_person__last_name"],
+            row["kind"],
+            timezone.localtime(row["period"]).date(),
+            row["duration"],
+        )
+
+
+def _period_counts(
+    recurring_shift: RecurringShift, first_day: datetime.date, last_day: datetime.date, period: str
+) -> Iterator[Tuple[datetime.date, int]]:
+    """
+    Yields the first day of each period from first_day through last_day that recurring_shift happens in, with how many
+    times it happens in it (ignoring exceptions). Occurrences are counted rather than listed.
+    """
+
+    first_day = max(first_day, recurring_shift.first_date)
+    last_day = min(last_day, recurring_shift.last_date)
+    if period != "month":
+        # A day or a week has at most one occurrence in it.
+        for date in occurrence_dates(recurring_shift, first_day, last_day):
+            yield _period_of(date, period), 1
+        return
+    month = first_day.replace(day=1)
+    while month <= last_day:
+        next_month = (month + datetime.timedelta(days=32)).replace(day=1)
+        first = max(first_day, month)
+        first += datetime.timedelta(days=(recurring_shift.weekday - first.weekday()) % 7)
+        last = min(last_day, next_month - datetime.timedelta(days=1))
+        if first <= last:
+            yield month, (last - first).days // 7 + 1
+        month = next_month
+
+
+def _skipped_counts(first_day: datetime.date, last_day: datetime.date, period: str) -> Counter:
+    """
+    Returns how many occurrences of each recurring shift were cancelled or materialized in each period from first_day
+    through last_day, by recurring shift ID and the first day of the period, with one query.
+    """
+
+    exceptions = (
+        RecurringShiftException.objects.filter(
+            date__range=(first_day, last_day),
+            date__gte=F("recurring_shift__first_date"),
+            date__lte=F("recurring_shift__last_date"),
+        )
+        # Only exceptions for days that the shift still happens on take anything away. (Weekdays count from Monday = 0
+        # in the model and Monday = 1 in ISO.)
+        .annotate(weekday=ExtractIsoWeekDay("date"))
+        .filter(weekday=F("recurring_shift__weekday") + 1)
+        .values_list("recurring_shift_id", "date")
+    )
+    return Counter((recurring_shift_id, _period_of(date, period)) for recurring_shift_id, date in exceptions.iterator())
+
+
+def _occurrence_rows(first_day: datetime.date, last_day: datetime.date, period: str) -> Iterator[HoursRow]:
+    """
+    Yields rows for the occurrences of recurring shifts from first_day through last_day, sorted like _shift_rows(). Each
+    recurring shift's occurrences are counted per period, and only one person and kind's rows are held at a time.
+    """
+
+    skipped = _skipped_counts(first_day, last_day, period)
+    range_start = timezone.make_aware(datetime.datetime.combine(first_day, datetime.time()))
+    range_end = timezone.make_aware(datetime.datetime.combine(last_day + datetime.timedelta(days=1), datetime.time()))
+    recurring_shifts = (
+        recurring_shifts_between(range_start, range_end)
+        .select_related("associated_person")
+        .order_by("associated_person_id", "kind", "id")
+    )
+    groups = itertools.groupby(
+        recurring_shifts.iterator(),
+        key=lambda recurring_shift: (recurring_shift.associated_person, recurring_shift.kind),
+    )
+    for (person, kind), group in groups:
+        durations: Dict[datetime.date, datetime.timedelta] = {}
+        for recurring_shift in group:
+            # Like shifts, occurrences count towards the period that they start in, which is the period of their date.
+            for start, count in _period_counts(recurring_shift, first_day, last_day, period):
+                count -= skipped[recurring_shift.id, start]
+                if count > 0:
+                    durations[start] = durations.get(start, datetime.timedelta()) + recurring_shift.duration * count
+        for start in sorted(durations):
+            yield HoursRow(
+                person.id, person.username, person.first_name, person.last_name, kind, start, durations[start]
+            )
+
+
+def hours_worked(first_day: datetime.date, last_day: datetime.date, period: str) -> Iterator[HoursRow]:
+    """
+    Yields how long each person worked at each kind of shift in each period (see PERIOD_CHOICES) from first_day through
+    last_day, sorted by person, kind and period.
+    """
+
+    range_start = timezone.make_aware(datetime.datetime.combine(first_day, datetime.time()))
+    range_end = timezone.make_aware(datetime.datetime.combine(last_day + datetime.timedelta(days=1), datetime.time()))
+    # Both are sorted the same way, so rows for the same person, kind and period end up next to each other.
+    merged = heapq.merge(
+        _shift_rows(range_start, range_end, period),
+        _occurrence_rows(first_day, last_day, period),
+        key=lambda row: row.key,
+    )
+    for _, group in itertools.groupby(merged, key=lambda row: row.key):
+        first, *rest = group
+        for row in rest:
+            first.duration += row.duration
+        yield first
+
+
+class _Echo:
+    """
+    A file-like object that returns what's written to it, so that csv.writer can produce one line at a time.
+    """
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def to_csv(rows: Iterable[HoursRow]) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(FIELDS)
+    for row in rows:
+        yield writer.writerow(row.as_record())
+
+
+def to_json(rows: Iterable[HoursRow]) -> Iterator[str]:
+    yield "["
+    separator = ""
+    for row in rows:
+        yield separator + json.dumps(dict(zip(FIELDS, row.as_record())), separators=(",", ":"))
+        separator = ","
+    yield "]"
+
+
+async def stream_async(chunks: Iterator[str]) -> AsyncIterator[str]:
+    """
+    Yields chunks for an ASGI server, making them STREAM_BATCH_SIZE at a time in the thread that sync views use (where
+    the database connection is), so the server sends them as they're made instead of reading the whole report first.
+    """
+
+    take = sync_to_async(lambda: list(itertools.islice(chunks, STREAM_BATCH_SIZE)), thread_sensitive=True)
+    while batch := await take():
+        yield "".join(batch)
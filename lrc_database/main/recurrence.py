@@ -0,0 +1,165 @@
+"""
+Expanding recurring shifts into their occurrences.
+
+A RecurringShift stands for every weekly occurrence between its first and last dates, so a semester of weekly shifts is
+a single row, and changing all of them is a single UPDATE. Occurrences are only worked out for the range of time that
+is being looked at, e.g. the weeks shown on a calendar.
+
+An occurrence only gets a Shift row of its own when it's materialized, which happens when someone wants to change just
+that one occurrence through a ShiftChangeRequest. Materialized and cancelled occurrences are both recorded as
+RecurringShiftExceptions, so they aren't expanded any more.
+"""
+
+import datetime
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from .models import MAX_SHIFT_DURATION, RecurringShift, RecurringShiftException, Shift
+from .schedules import invalidate_schedules
+
+
+@dataclass(frozen=True)
+class Occurrence:
+    recurring_shift: RecurringShift
+    date: datetime.date
+    start: datetime.datetime
+
+    @property
+    def end(self) -> datetime.datetime:
+        return self.start + self.recurring_shift.duration
+
+    @property
+    def associated_person_id(self) -> int:
+        return self.recurring_shift.associated_person_id
+
+    @property
+    def duration(self) -> datetime.timedelta:
+        return self.recurring_shift.duration
+
+    @property
+    def location(self) -> str:
+        return self.recurring_shift.location
+
+    @property
+    def kind(self) -> str:
+        return self.recurring_shift.kind
+
+    def __str__(self):
+        return f"{self.recurring_shift.associated_person} in {self.location} at {self.start}"
+
+
+def occurrence_dates(
+    recurring_shift: RecurringShift, first_day: datetime.date, last_day: datetime.date
+) -> Iterator[datetime.date]:
+    """
+    Yields the dates from first_day through last_day that recurring_shift happens on, ignoring exceptions.
+    """
+
+    day = max(first_day, recurring_shift.first_date)
+    last_day = min(last_day, recurring_shift.last_date)
+    day += datetime.timedelta(days=(recurring_shift.weekday - day.weekday()) % 7)
+    while day <= last_day:
+        yield day
+        day += datetime.timedelta(days=7)
+
+
+def is_occurrence_date(recurring_shift: RecurringShift, date: datetime.date) -> bool:
+    return recurring_shift.first_date <= date <= recurring_shift.last_date and date.weekday() == recurring_shift.weekday
+
+
+def occurrence_start(recurring_shift: RecurringShift, date: datetime.date) -> datetime.datetime:
+    # Occurrences start at the same local time every week, even when daylight saving time begins or ends in between.
+    return timezone.make_aware(datetime.datetime.combine(date, recurring_shift.start_time))
+
+
+def expand(
+    recurring_shifts: Iterable[RecurringShift], range_start: datetime.datetime, range_end: datetime.datetime
+) -> List[Occurrence]:
+    """
+    Returns the occurrences of recurring_shifts that overlap the time from range_start up to range_end, sorted by when
+    they start, leaving out the ones that were cancelled or materialized. The exceptions for all of the recurring shifts
+    are looked up with one query.
+    """
+
+    first_day = timezone.localtime(range_start - MAX_SHIFT_DURATION).date()
+    last_day = timezone.localtime(range_end).date()
+    recurring_shifts = list(recurring_shifts)
+    if not recurring_shifts:
+        return []
+    skipped = set(
+        RecurringShiftException.objects.filter(
+            recurring_shift__in=[recurring_shift.id for recurring_shift in recurring_shifts],
+            date__range=(first_day, last_day),
+        ).values_list("recurring_shift_id", "date")
+    )
+    occurrences = []
+    for recurring_shift in recurring_shifts:
+        for date in occurrence_dates(recurring_shift, first_day, last_day):
+            if (recurring_shift.id, date) in skipped:
+                continue
+            occurrence = Occurrence(recurring_shift, date, occurrence_start(recurring_shift, date))
+            if occurrence.start < range_end and occurrence.end > range_start:
+                occurrences.append(occurrence)
+    occurrences.sort(key=lambda occurrence: occurrence.start)
+    return occurrences
+
+
+def recurring_shifts_between(range_start: datetime.datetime, range_end: datetime.datetime) -> QuerySet[RecurringShift]:
+    """
+    Returns the recurring shifts whose dates could have occurrences that overlap the time from range_start up to
+    range_end, for passing to expand().
+    """
+
+    return RecurringShift.objects.filter(
+        first_date__lte=timezone.localtime(range_end).date(),
+        last_date__gte=timezone.localtime(range_start - MAX_SHIFT_DURATION).date(),
+    )
+
+
+def materialize(recurring_shift: RecurringShift, date: datetime.date) -> Shift:
+    """
+    Returns the Shift for the occurrence of recurring_shift on date, creating it (and the exception that stops the
+    occurrence from being expanded) if it doesn't exist yet.
+    """
+
+    with transaction.atomic():
+        RecurringShiftException.objects.get_or_create(recurring_shift=recurring_shift, date=date)
+        shift, _ = Shift.objects.get_or_create(
+            recurrence=recurring_shift,
+            occurrence_date=date,
+            defaults={
+                "associated_person_id": recurring_shift.associated_person_id,
+                "start": occurrence_start(recurring_shift, date),
+                "duration": recurring_shift.duration,
+                "location": recurring_shift.location,
+                "kind": recurring_shift.kind,
+            },
+        )
+    return shift
+
+
+def cancel(occurrences: Iterable[Occurrence]) -> int:
+    """
+    Stops occurrences from happening, and returns how many were cancelled. The exceptions are inserted in bulk, which
+    doesn't send signals, so the schedules and course coverage of the people affected are updated here.
+    """
+
+    # main.coverage expands recurring shifts with this module, so it can't be imported at the top.
+    from .coverage import refresh_tutoring_coverage
+
+    occurrences = list(occurrences)
+    RecurringShiftException.objects.bulk_create(
+        [
+            RecurringShiftException(recurring_shift=occurrence.recurring_shift, date=occurrence.date)
+            for occurrence in occurrences
+        ],
+        ignore_conflicts=True,
+    )
+    person_ids = {occurrence.associated_person_id for occurrence in occurrences}
+    invalidate_schedules(person_ids)
+    refresh_tutoring_coverage(person_ids)
+    return len(occurrences)
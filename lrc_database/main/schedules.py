@@ -0,0 +1,24 @@
+"""
+Per-user schedule versions.
+
+Every user's schedule has a version that is bumped whenever one of their shifts is added, changed or removed. Anything
+derived from a schedule (like the calendar feeds) can use it to tell whether it's still current without querying the
+shifts themselves.
+"""
+
+from typing import Iterable
+
+from .caching import bump_version, get_version
+
+
+def schedule_version_name(user_id: int) -> str:
+    return f"schedule:{user_id}"
+
+
+def get_schedule_version(user_id: int) -> int:
+    return get_version(schedule_version_name(user_id))
+
+
+def invalidate_schedules(user_ids: Iterable[int]) -> None:
+    for user_id in user_ids:
+        bump_version(schedule_version_name(user_id))
@@ -0,0 +1,232 @@
+"""
+Searching users, courses and hardware by name.
+
+Everything that can be found is copied into one full-text index: a SQLite FTS5 table, or on PostgreSQL a table with a
+GIN-indexed tsvector and a trigram index over the titles (so that misspelt names still turn up). Every word of a query
+matches by prefix, so results can be shown while a name is still being typed, and finding them is an index lookup
+however many rows there are.
+
+Each entry's ID is the object's primary key times KIND_COUNT plus the number of its kind, so an object's entry can be
+replaced through the table's primary key, and a search can be limited to some kinds without another column.
+
+The signal receivers in main/signals.py keep the index up to date. Anything that writes users, courses or hardware in
+bulk has to call index_objects() or rebuild_search_index() itself, and the whole index is rebuilt after every migrate.
+"""
+
+import itertools
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Model
+from django.urls import reverse
+
+from .models import Course, Hardware, LRCDatabaseUser
+
+SEARCH_TABLE = "main_search_index"
+
+# The kinds of objects in the index, numbered for their entries' IDs.
+KINDS: Dict[str, Tuple[int, type]] = {
+    "user": (1, LRCDatabaseUser),
+    "course": (2, Course),
+    "hardware": (3, Hardware),
+}
+KIND_COUNT = 4
+
+# Views that show each kind of object.
+KIND_URL_NAMES = {"user": "user_profile", "course": "view_course", "hardware": "edit_hardware"}
+
+# Only this many words of a query are searched for, since each one is another index lookup.
+MAX_QUERY_WORDS = 8
+
+# How many entries are written to the index in each statement.
+BATCH_SIZE = 500
+
+# Words are runs of letters and digits, which is also how both databases split up what they index.
+WORD = re.compile(r"[^\W_]+")
+
+# Email addresses are only indexed by the part before the @. Nearly all of them end with the same domain, and ranking
+# every entry that matches it would take as long as a search without an index.
+EMAIL_DOMAIN = re.compile(r"@\S*")
+
+# Queries shorter than this are ignored, since a single letter matches too much of the index to be worth ranking.
+MIN_QUERY_LENGTH = 2
+
+# The fields of each model that are indexed. Saving only other fields (like a user's last_login) doesn't reindex.
+INDEXED_FIELDS = {
+    LRCDatabaseUser: {"first_name", "last_name", "username", "email"},
+    Course: {"department", "number", "name"},
+    Hardware: {"name"},
+}
+
+CREATE_TABLE = {
+    # The prefix option keeps separate indexes of the first two and three characters of every word, which is what
+    # typeahead queries are mostly made of.
+    "sqlite": [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+        "USING fts5(title, body, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    ],
+    "postgresql": [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (id bigint PRIMARY KEY, title text NOT NULL, body text NOT NULL, "
+        "document tsvector GENERATED ALWAYS AS (to_tsvector('simple', title || ' ' || body)) STORED)",
+        f"CREATE INDEX IF NOT EXISTS search_document_idx ON {SEARCH_TABLE} USING gin (document)",
+        f"CREATE INDEX IF NOT EXISTS search_title_trgm_idx ON {SEARCH_TABLE} USING gin (title gin_trgm_ops)",
+    ],
+}
+
+ID_COLUMN = {"sqlite": "rowid", "postgresql": "id"}
+
+# These take the query and the number of results, and {kinds} is replaced with a placeholder for each kind to include.
+# Entries are ranked so that a match in the title counts for more than one in the body.
+SEARCH_SQL = {
+    "sqlite": f"SELECT rowid, title, body FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+    f"AND rowid %% {KIND_COUNT} IN ({{kinds}}) ORDER BY bm25({SEARCH_TABLE}, 10.0, 1.0) LIMIT %s",
+    "postgresql": f"SELECT id, title, body FROM {SEARCH_TABLE}, to_tsquery('simple', %s) AS query "
+    f"WHERE document @@ query AND id %% {KIND_COUNT} IN ({{kinds}}) "
+    "ORDER BY ts_rank(setweight(to_tsvector('simple', title), 'A') || document, query) DESC LIMIT %s",
+}
+
+# Used on PostgreSQL when no entry has every word of the query, e.g. because a name was misspelt. It takes the query
+# twice, then the number of results.
+SIMILAR_SQL = (
+    f"SELECT id, title, body FROM {SEARCH_TABLE} WHERE title %% %s AND id %% {KIND_COUNT} IN ({{kinds}}) "
+    "ORDER BY similarity(title, %s) DESC LIMIT %s"
+)
+
+
+@dataclass
+class SearchResult:
+    kind: str
+    object_id: int
+    title: str
+    detail: str
+
+    @property
+    def url(self) -> str:
+        return reverse(KIND_URL_NAMES[self.kind], args=(self.object_id,))
+
+
+def _kind_of(model: type) -> str:
+    for kind, (_, kind_model) in KINDS.items():
+        if issubclass(model, kind_model):
+            return kind
+    raise ValueError(f"{model.__name__} isn't searchable.")
+
+
+def _entry_id(kind: str, object_id: int) -> int:
+    return object_id * KIND_COUNT + KINDS[kind][0]
+
+
+def _document(instance: Model) -> Tuple[str, str]:
+    """
+    Returns the title and body of instance's entry. Titles are shown as the results, and bodies add what else they can
+    be found by.
+    """
+
+    if isinstance(instance, LRCDatabaseUser):
+        name = f"{instance.first_name} {instance.last_name}".strip()
+        # Usernames are often the same as the start of the email address.
+        body = " ".join(dict.fromkeys([instance.username, EMAIL_DOMAIN.sub("", instance.email)]))
+        return name or instance.username, body
+    return str(instance), ""
+
+
+def is_indexed_change(model: type, update_fields) -> bool:
+    """
+    Returns whether saving an instance of model with update_fields (as passed to post_save) can change its entry.
+    """
+
+    return update_fields is None or bool(INDEXED_FIELDS[model] & set(update_fields))
+
+
+def remove_from_index(model: type, object_ids: Iterable[int], using: str = DEFAULT_DB_ALIAS) -> None:
+    connection = connections[using]
+    if connection.vendor not in CREATE_TABLE:
+        return
+    kind = _kind_of(model)
+    entry_ids = [_entry_id(kind, object_id) for object_id in object_ids]
+    with connection.cursor() as cursor:
+        for start in range(0, len(entry_ids), BATCH_SIZE):
+            batch = entry_ids[start : start + BATCH_SIZE]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(
+                # The table and column names are constants, and the IDs are passed as parameters.
+                f"DELETE FROM {SEARCH_TABLE} WHERE {ID_COLUMN[connection.vendor]} IN ({placeholders})",  # nosec
+                batch,
+            )
+
+
+def _insert(kind: str, instances: List[Model], using: str) -> None:
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} ({ID_COLUMN[connection.vendor]}, title, body) VALUES (%s, %s, %s)",
+            [(_entry_id(kind, instance.pk), *_document(instance)) for instance in instances],
+        )
+
+
+def index_objects(instances: Iterable[Model], using: str = DEFAULT_DB_ALIAS) -> None:
+    """
+    Adds instances (which are all of one model) to the index, replacing their old entries.
+    """
+
+    instances = list(instances)
+    if not instances or connections[using].vendor not in CREATE_TABLE:
+        return
+    model = type(instances[0])
+    with transaction.atomic(using=using):
+        remove_from_index(model, [instance.pk for instance in instances], using)
+        _insert(_kind_of(model), instances, using)
+
+
+def rebuild_search_index(using: str = DEFAULT_DB_ALIAS) -> None:
+    """
+    Creates the index if it doesn't exist, and fills it with everything that can be found.
+    """
+
+    connection = connections[using]
+    if connection.vendor not in CREATE_TABLE:
+        return
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            for statement in CREATE_TABLE[connection.vendor]:
+                cursor.execute(statement)
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")  # nosec: the table name is a constant.
+        for kind, (_, model) in KINDS.items():
+            instances = model._default_manager.using(using).only(*INDEXED_FIELDS[model]).iterator(BATCH_SIZE)
+            while batch := list(itertools.islice(instances, BATCH_SIZE)):
+                _insert(kind, batch, using)
+
+
+def search(query: str, kinds: Iterable[str], limit: int = 10) -> List[SearchResult]:
+    """
+    Returns up to limit of the objects of kinds with every word of query at the start of a word of their entry, best
+    matches first.
+    """
+
+    query = EMAIL_DOMAIN.sub("", query).strip()
+    words = WORD.findall(query.lower())[:MAX_QUERY_WORDS]
+    kind_numbers = [KINDS[kind][0] for kind in kinds]
+    connection = connections[DEFAULT_DB_ALIAS]
+    if len(query) < MIN_QUERY_LENGTH or not words or not kind_numbers or connection.vendor not in SEARCH_SQL:
+        return []
+    placeholders = ", ".join(["%s"] * len(kind_numbers))
+    if connection.vendor == "sqlite":
+        # Quoting each word stops FTS5 from reading it as an operator, like OR or NOT.
+        match = " ".join(f'"{word}"*' for word in words)
+    else:
+        match = " & ".join(f"{word}:*" for word in words)
+    with connection.cursor() as cursor:
+        # Only placeholders are formatted into the SQL.
+        cursor.execute(SEARCH_SQL[connection.vendor].format(kinds=placeholders), [match, *kind_numbers, limit])  # nosec
+        rows = cursor.fetchall()
+        if not rows and connection.vendor == "postgresql":
+            cursor.execute(SIMILAR_SQL.format(kinds=placeholders), [query, *kind_numbers, query, limit])  # nosec
+            rows = cursor.fetchall()
+    kind_names = {number: kind for kind, (number, _) in KINDS.items()}
+    return [
+        SearchResult(kind_names[entry_id % KIND_COUNT], entry_id // KIND_COUNT, title, body)
+        for entry_id, title, body in rows
+    ]
@@ -0,0 +1,174 @@
+"""
+Signal receivers that keep cached data in sync with the database. They're connected in MainConfig.ready().
+"""
+
+import datetime
+
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .alerts import invalidate_alert_counts
+from .caching import bump_version
+from .coverage import is_in_current_week, refresh_course_coverage, refresh_tutoring_coverage
+from .ical import forget_feed_owners
+from .membership import ALL_GROUPS_VERSION, GROUP_NAMES_ATTRIBUTE, invalidate_group_names
+from .models import (
+    Course,
+    Hardware,
+    LRCDatabaseUser,
+    RecurringShift,
+    RecurringShiftException,
+    Shift,
+    ShiftChangeRequest,
+)
+from .navbar import invalidate_navbars
+from .schedules import invalidate_schedules
+from .search import index_objects, is_indexed_change, remove_from_index
+
+
+@receiver(m2m_changed, sender=LRCDatabaseUser.groups.through)
+def group_membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        # instance is a user.
+        instance.__dict__.pop(GROUP_NAMES_ATTRIBUTE, None)
+        invalidate_group_names([instance.pk])
+    elif action == "post_clear":
+        # instance is a group, and the users who were in it are no longer known.
+        bump_version(ALL_GROUPS_VERSION)
+    else:
+        # instance is a group, and pk_set holds the users who were added or removed.
+        invalidate_group_names(pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, **kwargs):
+    bump_version(ALL_GROUPS_VERSION)
+
+
+@receiver(pre_save, sender=LRCDatabaseUser)
+def user_about_to_change(sender, instance, raw, update_fields, **kwargs):
+    if instance.pk is None or raw or (update_fields is not None and not {"si_course", "si_course_id"} & update_fields):
+        return
+    # Remember which course the user led SI for, since changing it changes the coverage of both courses.
+    instance._previous_si_course_id = (
+        sender.objects.filter(pk=instance.pk).values_list("si_course_id", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=LRCDatabaseUser)
+def user_changed(sender, instance, created, **kwargs):
+    # The user's name, feed version or whether they're active may have changed.
+    forget_feed_owners([instance.pk])
+    if created:
+        course_ids = {instance.si_course_id}
+    else:
+        invalidate_navbars([instance.pk])
+        # Their groups may have been changed without going through user.groups (e.g. by loaddata or the through model),
+        # which sends no m2m_changed, so their cached group names are dropped too.
+        instance.__dict__.pop(GROUP_NAMES_ATTRIBUTE, None)
+        invalidate_group_names([instance.pk])
+        previous_si_course_id = instance.__dict__.pop("_previous_si_course_id", instance.si_course_id)
+        course_ids = (
+            {previous_si_course_id, instance.si_course_id} if previous_si_course_id != instance.si_course_id else set()
+        )
+    refresh_course_coverage(course_ids - {None})
+
+
+@receiver(pre_delete, sender=LRCDatabaseUser)
+def user_about_to_be_deleted(sender, instance, **kwargs):
+    # The user's course assignments are deleted along with them, without sending m2m_changed.
+    instance._covered_course_ids = set(instance.courses_tutored.values_list("id", flat=True)) | {instance.si_course_id}
+
+
+@receiver(post_delete, sender=LRCDatabaseUser)
+def user_deleted(sender, instance, **kwargs):
+    forget_feed_owners([instance.pk])
+    refresh_course_coverage(instance._covered_course_ids - {None})
+
+
+@receiver(m2m_changed, sender=LRCDatabaseUser.courses_tutored.through)
+def courses_tutored_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        # instance is a course.
+        refresh_course_coverage([instance.pk])
+    elif action == "post_clear":
+        # instance is a user, and the courses that they tutored are no longer known.
+        refresh_course_coverage()
+    else:
+        # instance is a user, and pk_set holds the courses that were added or removed.
+        refresh_course_coverage(pk_set)
+
+
+@receiver(post_save, sender=Course)
+def course_changed(sender, instance, created, **kwargs):
+    if created:
+        refresh_course_coverage([instance.pk])
+
+
+@receiver(post_save, sender=ShiftChangeRequest)
+@receiver(post_delete, sender=ShiftChangeRequest)
+@receiver(post_save, sender=Shift)
+@receiver(post_delete, sender=Shift)
+def alert_counts_changed(sender, **kwargs):
+    invalidate_alert_counts()
+
+
+@receiver(pre_save, sender=Shift)
+@receiver(pre_save, sender=RecurringShift)
+def shift_about_to_change(sender, instance, raw, **kwargs):
+    if instance.pk is None or raw:
+        return
+    # Remember who the shift belonged to, since reassigning it changes that person's schedule too, and when it started,
+    # since moving it out of this week changes the coverage of the person's courses.
+    fields = ["associated_person_id", "start"] if sender is Shift else ["associated_person_id"]
+    previous = sender.objects.filter(pk=instance.pk).values(*fields).first() or {}
+    instance._previous_associated_person_id = previous.get("associated_person_id")
+    instance._previous_start = previous.get("start")
+
+
+@receiver(post_save, sender=Shift)
+@receiver(post_delete, sender=Shift)
+@receiver(post_save, sender=RecurringShift)
+@receiver(post_delete, sender=RecurringShift)
+def shift_changed(sender, instance, **kwargs):
+    user_ids = {instance.associated_person_id, getattr(instance, "_previous_associated_person_id", None)}
+    invalidate_schedules(user_ids - {None})
+    if sender is RecurringShift or any(
+        is_in_current_week(start) for start in (instance.start, getattr(instance, "_previous_start", None))
+    ):
+        refresh_tutoring_coverage(user_ids)
+
+
+@receiver(post_save, sender=RecurringShiftException)
+@receiver(post_delete, sender=RecurringShiftException)
+def recurring_shift_exception_changed(sender, instance, **kwargs):
+    # The recurring shift is already gone if it's being deleted along with its exceptions, but then it invalidates the
+    # schedule itself.
+    user_ids = list(
+        RecurringShift.objects.filter(pk=instance.recurring_shift_id).values_list("associated_person_id", flat=True)
+    )
+    invalidate_schedules(user_ids)
+    if is_in_current_week(timezone.make_aware(datetime.datetime.combine(instance.date, datetime.time()))):
+        refresh_tutoring_coverage(user_ids)
+
+
+@receiver(post_save, sender=LRCDatabaseUser)
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Hardware)
+def searchable_object_changed(sender, instance, raw, update_fields, using, **kwargs):
+    if not raw and is_indexed_change(sender, update_fields):
+        index_objects([instance], using)
+
+
+@receiver(post_delete, sender=LRCDatabaseUser)
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Hardware)
+def searchable_object_deleted(sender, instance, using, **kwargs):
+    remove_from_index(sender, [instance.pk], using)
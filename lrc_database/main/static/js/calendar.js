@@ -3,7 +3,8 @@ document.addEventListener('DOMContentLoaded', function () {
   let calendar = new FullCalendar.Calendar(calendarEl, {
     initialView: 'dayGridMonth',
     themeSystem: 'bootstrap5',
-    events: events,
+    // FullCalendar fetches just the visible range, passing it in the start and end parameters.
+    events: calendarEl.dataset.eventsUrl,
   });
   calendar.render();
 });
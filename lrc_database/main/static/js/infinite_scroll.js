@@ -0,0 +1,20 @@
+// Paginated tables end with a "Load more" link to the next page. Rather than following it, fetch just the rows of the
+// next page and put them in place of the link, which they'll bring their own copy of if there are more pages.
+document.addEventListener('click', function (event) {
+  let link = event.target.closest('a.load-more');
+  if (!link) {
+    return;
+  }
+  event.preventDefault();
+  let url = new URL(link.href);
+  url.searchParams.set('fragment', '1');
+  fetch(url)
+    .then(function (response) {
+      return response.text();
+    })
+    .then(function (rows) {
+      let row = link.closest('tr');
+      row.insertAdjacentHTML('afterend', rows);
+      row.remove();
+    });
+});
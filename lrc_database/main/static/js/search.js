@@ -0,0 +1,41 @@
+// The search box in the navbar shows the best results as the user types, by fetching just the results from the search
+// page. Requests are only sent once typing pauses, and results that arrive after newer ones are thrown away.
+document.addEventListener('DOMContentLoaded', function () {
+  let input = document.getElementById('navbar-search');
+  if (!input) {
+    return;
+  }
+  let results = document.getElementById('navbar-search-results');
+  let timer = null;
+  let latest = 0;
+  input.addEventListener('input', function () {
+    clearTimeout(timer);
+    // Single letters aren't searched for.
+    if (input.value.trim().length < 2) {
+      results.replaceChildren();
+      results.hidden = true;
+      return;
+    }
+    timer = setTimeout(function () {
+      let request = ++latest;
+      let url = new URL(input.form.action, window.location.href);
+      url.searchParams.set('q', input.value);
+      url.searchParams.set('fragment', '1');
+      fetch(url)
+        .then(function (response) {
+          return response.text();
+        })
+        .then(function (html) {
+          if (request === latest) {
+            results.innerHTML = html;
+            results.hidden = false;
+          }
+        });
+    }, 150);
+  });
+  input.addEventListener('keydown', function (event) {
+    if (event.key === 'Escape') {
+      results.hidden = true;
+    }
+  });
+});
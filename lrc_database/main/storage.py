@@ -0,0 +1,45 @@
+"""
+Static file storage for production.
+
+collectstatic stores every static file under a name that includes a hash of its contents, so that nginx can tell
+browsers to cache it forever: a changed file gets a new name. It also writes gzip and Brotli-compressed copies of the
+files that compress well next to them, so that nginx can serve those as they are instead of compressing every response.
+"""
+
+import gzip
+from typing import Iterator
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional (see the "brotli" extra in pyproject.toml). Only gzip copies are written without it.
+    brotli = None
+
+# Fonts like WOFF2 and images are compressed already.
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".map", ".svg", ".json", ".txt")
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def _write_compressed(self, name: str) -> None:
+        with self.open(name) as file:
+            content = file.read()
+        variants = [(".gz", gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append((".br", brotli.compress(content, quality=11)))
+        for suffix, compressed in variants:
+            # nginx falls back to the uncompressed file when there's no smaller copy.
+            if len(compressed) < len(content):
+                with open(self.path(name + suffix), "wb") as file:
+                    file.write(compressed)
+
+    def post_process(self, paths, dry_run=False, **options) -> Iterator:
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Both the original names and the hashed ones are served, so both are compressed.
+        for name, hashed_name in self.hashed_files.items():
+            for stored_name in {name, hashed_name}:
+                if stored_name.endswith(COMPRESSIBLE_EXTENSIONS) and self.exists(stored_name):
+                    self._write_compressed(stored_name)
@@ -1,10 +1,8 @@
 from django import template
 
-register = template.Library()
-
+from ..membership import is_in_groups
 
-def is_in_groups(user, *groups):
-    return user.is_authenticated and user.groups.filter(name__in=groups).exists()
+register = template.Library()
 
 
 @register.filter
@@ -0,0 +1,13 @@
+from django import template
+
+from ..navbar import render_navbar
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def navbar(context):
+    """
+    Renders includes/navbar.html for the current user, or reuses the copy cached for them.
+    """
+    return render_navbar(context["user"])
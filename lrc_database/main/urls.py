@@ -10,33 +10,56 @@ urlpatterns = [
     path("courses/<int:course_id>", views.view_course, name="view_course"),
     path("courses/<int:course_id>/edit", views.edit_course, name="edit_course"),
     path("courses/add", views.add_course, name="add_course"),
+    path("courses/coverage", views.course_coverage, name="course_coverage"),
     path(
         "scheduling/shift_change_requests/<str:kind>",
         views.view_shift_change_requests,
         name="view_shift_change_requests",
     ),
+    path(
+        "scheduling/shift_change_requests/<str:kind>/approve",
+        views.approve_shift_change_requests,
+        name="approve_shift_change_requests",
+    ),
+    path("scheduling/payroll", views.payroll_report, name="payroll_report"),
     path("scheduling/bulk/drop_on_date", drop_shifts_on_date, name="drop_shifts_on_date"),
     path(
         "scheduling/bulk/drop_on_date/confirm",
         drop_shifts_on_date_confirmation,
         name="drop_shifts_on_date_confirmation",
     ),
+    path("search", views.search, name="search"),
     path("shifts/<int:shift_id>", views.view_shift, name="view_shift"),
     path(
         "shifts/<int:shift_id>/request_change",
         views.new_shift_change_request,
         name="new_shift_change_request",
     ),
+    path(
+        "shifts/recurring/<int:recurring_shift_id>/<str:date>",
+        views.view_occurrence,
+        name="view_occurrence",
+    ),
+    path(
+        "shifts/recurring/<int:recurring_shift_id>/<str:date>/request_change",
+        views.new_occurrence_change_request,
+        name="new_occurrence_change_request",
+    ),
     path("users/<int:user_id>", views.user_profile, name="user_profile"),
+    path("users/<int:user_id>/shifts.json", views.user_shift_events, name="user_shift_events"),
+    path("users/calendar/<str:token>.ics", views.user_calendar_feed, name="user_calendar_feed"),
     path("users/<int:user_id>/edit", views.edit_profile, name="edit_profile"),
-    path("users/<str:group>", views.list_users, name="list_users"),
+    path("users/<int:user_id>/calendar/reset", views.reset_calendar_feed, name="reset_calendar_feed"),
     path("show_hardware", views.show_hardware, name="showHardware"),
     path("show_loans", views.show_loans, name="showLoans"),
     path("edit_loans/<int:loan_id>", views.edit_loans, name="edit_loans"),
+    path("return_loan/<int:loan_id>", views.return_loan, name="return_loan"),
     path("edit_hardware/<int:hardware_id>", views.edit_hardware, name="edit_hardware"),
     path("add_hardware", views.add_hardware, name="add_hardware"),
     path("add_loans", views.add_loans, name="add_loans"),
     path("users/create", views.create_user, name="create_user"),
     path("users/create/bulk", views.create_users_in_bulk, name="create_users_in_bulk"),
+    # This must come after the other users/ paths, or it will match them too.
+    path("users/<str:group>", views.list_users, name="list_users"),
     path("users/groups/<str:group>", views.list_users, name="list_users"),
 ]
@@ -0,0 +1,163 @@
+"""
+Creating many users at once from CSV data.
+
+Every row is checked before anything is written, so an import either creates all of its users or none of them. The
+users and their group memberships are then each written with a single bulk insert.
+
+Hashing passwords is by far the slowest part of creating a user, and it's done in the current process, since starting
+processes from inside a web server's worker isn't safe. Imports from the web page are limited to MAX_WEB_IMPORT_ROWS
+users so that they finish within a request; larger ones go through manage.py importusers.
+"""
+
+import csv
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import transaction
+
+from .models import LRCDatabaseUser
+from .search import index_objects
+
+# The columns that each row must have, in order.
+COLUMNS = ("username", "email", "first_name", "last_name", "primary_group", "password")
+
+# The most users that one import from the web page can create. Each password takes a few hundred milliseconds to hash.
+MAX_WEB_IMPORT_ROWS = 100
+
+# How many rows are sent to the database in each INSERT.
+BATCH_SIZE = 500
+
+
+@dataclass
+class UserImportRow:
+    line_number: int
+    username: str
+    email: str
+    first_name: str
+    last_name: str
+    primary_group: str
+    password: str
+
+
+@dataclass
+class UserImportResult:
+    created_count: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+def parse_rows(lines: Iterable[str], errors: List[str]) -> List[UserImportRow]:
+    """
+    Reads CSV rows from lines, adding a message to errors for each row that doesn't have the right number of columns.
+    Blank lines and a header line naming the columns are skipped.
+    """
+
+    rows = []
+    for line_number, values in enumerate(csv.reader(lines), start=1):
+        values = [value.strip() for value in values]
+        if not any(values):
+            continue
+        if line_number == 1 and tuple(values) == COLUMNS:
+            continue
+        if len(values) != len(COLUMNS):
+            errors.append(f"Line {line_number}: expected {len(COLUMNS)} values but found {len(values)}.")
+            continue
+        rows.append(UserImportRow(line_number, *values))
+    return rows
+
+
+def validate_rows(rows: List[UserImportRow], groups: Dict[str, Group], errors: List[str]) -> None:
+    """
+    Checks every row, adding a message to errors for each problem. Looking up existing usernames takes one query per
+    BATCH_SIZE rows, no matter how many rows there are.
+    """
+
+    usernames = [row.username for row in rows]
+    existing_usernames: Set[str] = set()
+    for i in range(0, len(usernames), BATCH_SIZE):
+        existing_usernames.update(
+            LRCDatabaseUser.objects.filter(username__in=usernames[i : i + BATCH_SIZE]).values_list(
+                "username", flat=True
+            )
+        )
+    seen_usernames: Set[str] = set()
+    for row in rows:
+        prefix = f"Line {row.line_number} ({row.username})"
+        # Checks each value against its field (lengths, the characters allowed in usernames, email addresses and so
+        # on), so that nothing can make the insert fail part way through. Uniqueness is checked below for all the rows
+        # at once.
+        user = LRCDatabaseUser(
+            username=row.username, email=row.email, first_name=row.first_name, last_name=row.last_name
+        )
+        try:
+            user.full_clean(exclude=["password"], validate_unique=False)
+        except ValidationError as error:
+            for field_name, messages in error.message_dict.items():
+                if field_name == NON_FIELD_ERRORS:
+                    errors.extend(f"{prefix}: {message}" for message in messages)
+                else:
+                    label = LRCDatabaseUser._meta.get_field(field_name).verbose_name
+                    errors.extend(f"{prefix}: {label}: {message}" for message in messages)
+        if row.username in existing_usernames:
+            errors.append(f"{prefix}: a user with this username already exists.")
+        elif row.username in seen_usernames:
+            errors.append(f"{prefix}: this username appears more than once.")
+        seen_usernames.add(row.username)
+        if row.primary_group not in groups:
+            errors.append(f"{prefix}: there is no group called {row.primary_group}.")
+        if not row.password:
+            errors.append(f"{prefix}: the password can't be blank.")
+
+
+def import_users(lines: Iterable[str], max_rows: Optional[int] = None) -> UserImportResult:
+    """
+    Creates a user for every row of CSV data in lines, and adds each of them to their primary group. If any row has a
+    problem, or there are more than max_rows rows, no users are created and the result lists every problem that was
+    found.
+    """
+
+    result = UserImportResult()
+    rows = parse_rows(lines, result.errors)
+    if max_rows is not None and len(rows) > max_rows:
+        result.errors.append(
+            f"There are {len(rows)} users, but at most {max_rows} can be created at once here. Split them up, or ask an "
+            "administrator to run manage.py importusers."
+        )
+        return result
+    groups = Group.objects.in_bulk({row.primary_group for row in rows}, field_name="name")
+    validate_rows(rows, groups, result.errors)
+    if result.errors or not rows:
+        return result
+    password_hashes = [make_password(row.password) for row in rows]
+    users = [
+        LRCDatabaseUser(
+            username=row.username,
+            email=LRCDatabaseUser.objects.normalize_email(row.email),
+            first_name=row.first_name,
+            last_name=row.last_name,
+            password=password_hash,
+        )
+        for row, password_hash in zip(rows, password_hashes)
+    ]
+    Membership = LRCDatabaseUser.groups.through
+    with transaction.atomic():
+        users = LRCDatabaseUser.objects.bulk_create(users, batch_size=BATCH_SIZE)
+        if any(user.pk is None for user in users):
+            # Not every database reports the primary keys of rows inserted in bulk.
+            user_ids = dict(
+                LRCDatabaseUser.objects.filter(username__in=[user.username for user in users]).values_list(
+                    "username", "id"
+                )
+            )
+            for user in users:
+                user.pk = user_ids[user.username]
+        Membership.objects.bulk_create(
+            [Membership(lrcdatabaseuser_id=user.pk, group=groups[row.primary_group]) for row, user in zip(rows, users)],
+            batch_size=BATCH_SIZE,
+        )
+        # bulk_create() doesn't send post_save, which would normally add each user to the search index.
+        index_objects(users)
+    result.created_count = len(users)
+    return result
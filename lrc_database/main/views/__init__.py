@@ -1,17 +1,39 @@
+import asyncio
+import datetime
+import hashlib
 import json
 import logging
-from typing import Any, Callable, Concatenate, ParamSpec
+from typing import Any, Callable, Concatenate, Dict, Iterable, List, Optional, ParamSpec
 
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import Group
 from django.contrib.auth.views import redirect_to_login
 from django.core.exceptions import PermissionDenied
-from django.http import HttpRequest, HttpResponse, HttpResponseNotAllowed, HttpResponseRedirect
-from django.shortcuts import get_list_or_404, get_object_or_404, redirect, render
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
+from django.http import (
+    Http404,
+    HttpRequest,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseNotAllowed,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
-
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date, quote_etag
+
+from ..approvals import approve_change_requests
+from ..conflicts import find_change_request_conflicts
+from ..coverage import current_week, get_course_coverage
 from ..forms import (
     AddHardwareForm,
     CourseForm,
@@ -20,8 +42,17 @@ from ..forms import (
     EditProfileForm,
     NewChangeRequestForm,
     NewLoanForm,
+    PayrollForm,
 )
-from ..models import Course, Hardware, Loan, LRCDatabaseUser, Shift, ShiftChangeRequest
+from ..ical import feed_validators, get_feed_owner, make_feed_token, read_feed_token, stream_feed
+from ..membership import is_in_groups
+from ..models import Course, Hardware, Loan, LRCDatabaseUser, RecurringShift, Shift, ShiftChangeRequest
+from ..pagination import apaginate, paginate
+from ..payroll import hours_worked, stream_async, to_csv, to_json
+from ..recurrence import Occurrence, expand, is_occurrence_date, materialize, occurrence_start, recurring_shifts_between
+from ..schedules import get_schedule_version
+from ..search import search as search_index
+from ..user_import import MAX_WEB_IMPORT_ROWS, import_users
 
 User = get_user_model()
 log = logging.getLogger()
@@ -29,27 +60,73 @@ log = logging.getLogger()
 
 P = ParamSpec("P")
 
+# How many results a search shows.
+SEARCH_RESULT_COUNT = 20
+
+# The longest range of time that user_shift_events() returns events for. Calendars only ask for the weeks they show,
+# and every recurring shift in the range is expanded into its occurrences.
+MAX_EVENT_RANGE = datetime.timedelta(days=366)
+
+# Related objects shown for each row of includes/shift_change_request_table.html.
+CHANGE_REQUEST_TABLE_RELATED = ("target__associated_person", "approved_by", "new_associated_person")
+
+
+def _check_groups(request: HttpRequest, groups: Iterable[str]) -> Optional[HttpResponse]:
+    """
+    Returns a redirect to the login page if the user isn't logged in, raises PermissionDenied if they aren't in any of
+    groups, and returns None if they may go on.
+    """
+
+    if not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    if request.user.is_superuser or is_in_groups(request.user, *groups):
+        return None
+    raise PermissionDenied
+
 
 def restrict_to_groups(
     *groups: str,
 ) -> Callable[
     [Callable[Concatenate[HttpRequest, P], HttpResponse]], Callable[Concatenate[HttpRequest, P], HttpResponse]
 ]:
+    """
+    Annotation for views that only users in at least one of groups (or superusers) may see. Works with both sync and
+    async views.
+    """
+
     def decorator(
         view: Callable[Concatenate[HttpRequest, P], HttpResponse]
     ) -> Callable[Concatenate[HttpRequest, P], HttpResponse]:
+        if asyncio.iscoroutinefunction(view):
+
+            async def _async_wrapped_view(request: HttpRequest, *args: P.args, **kwargs: P.kwargs) -> HttpResponse:
+                # Loading the user and their groups queries the database, which can't be done from the event loop.
+                response = await sync_to_async(_check_groups)(request, groups)
+                return response or await view(request, *args, **kwargs)
+
+            return _async_wrapped_view  # type: ignore[return-value]
+
         def _wrapped_view(request: HttpRequest, *args: P.args, **kwargs: P.kwargs) -> HttpResponse:
-            if not request.user.is_authenticated:
-                return redirect_to_login(request.get_full_path())
-            if request.user.is_superuser or request.user.groups.filter(name__in=groups).exists():
-                return view(request, *args, **kwargs)
-            raise PermissionDenied
+            return _check_groups(request, groups) or view(request, *args, **kwargs)
 
         return _wrapped_view
 
     return decorator
 
 
+def async_login_required(view: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Like Django's login_required, for async views, which it doesn't support before Django 5.1.
+    """
+
+    async def _wrapped_view(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+
+    return _wrapped_view
+
+
 def restrict_to_http_methods(
     *methods: str,
 ) -> Callable[
@@ -75,35 +152,172 @@ def restrict_to_http_methods(
     return decorator
 
 
-@login_required
-def index(request):
-    pending_shift_change_requests = ShiftChangeRequest.objects.filter(
-        target__associated_person=request.user, approved=False
-    )
-    return render(request, "index.html", {"change_requests": pending_shift_change_requests})
+@async_login_required
+async def index(request):
+    pending_shift_change_requests = [
+        change_request
+        async for change_request in ShiftChangeRequest.objects.filter(
+            target__associated_person=request.user, approved=False
+        ).select_related(*CHANGE_REQUEST_TABLE_RELATED)
+    ]
+    return await sync_to_async(render)(request, "index.html", {"change_requests": pending_shift_change_requests})
 
 
 @login_required
 def user_profile(request, user_id):
     target_user = get_object_or_404(User, id=user_id)
-    target_users_shifts = Shift.objects.filter(associated_person=target_user)
-    target_users_shifts = [
+    context = {"target_user": target_user}
+    if request.user.id == target_user.id:
+        # Only the person themselves sees their feed's address, since anyone with it can read the feed.
+        context["calendar_feed_url"] = request.build_absolute_uri(
+            reverse("user_calendar_feed", args=(make_feed_token(target_user.id, target_user.calendar_feed_version),))
+        )
+    return render(request, "users/user_profile.html", context)
+
+
+@login_required
+@restrict_to_http_methods("POST")
+def reset_calendar_feed(request: HttpRequest, user_id: int) -> HttpResponse:
+    """
+    Gives the user a new calendar feed address, so that the old one (e.g. if it was shared by mistake) stops working.
+    """
+
+    if user_id != request.user.id:
+        raise PermissionDenied
+    user = get_object_or_404(User, pk=user_id)
+    user.calendar_feed_version += 1
+    user.save(update_fields=["calendar_feed_version"])
+    messages.add_message(
+        request,
+        messages.SUCCESS,
+        "Your calendar feed has a new address. Subscriptions to the old one will stop working.",
+    )
+    return redirect("user_profile", user_id)
+
+
+def _parse_event_range_bound(value: Optional[str]) -> Optional[datetime.datetime]:
+    """
+    Parses one of the start/end parameters that FullCalendar sends when fetching events. They're ISO 8601 dates or
+    datetimes, with or without a UTC offset.
+    """
+
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            parsed_date = parse_date(value)
+            if parsed_date is None:
+                return None
+            parsed = datetime.datetime.combine(parsed_date, datetime.time())
+    except ValueError:
+        return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _shift_events_etag(request: HttpRequest, user_id: int) -> str:
+    tag = f"{user_id}:{get_schedule_version(user_id)}:{request.GET.get('start')}:{request.GET.get('end')}"
+    return hashlib.sha256(tag.encode()).hexdigest()[:32]
+
+
+def _shift_events(shifts: Iterable[Dict[str, Any]], occurrences: List[Occurrence], person: str) -> List[Dict[str, Any]]:
+    # view_shift's URL ends with the shift ID, so it only needs to be reversed once.
+    shift_url_prefix = reverse("view_shift", args=(0,)).removesuffix("0")
+    events = [
         {
-            "id": str(shift.id),
-            "start": shift.start.isoformat(),
-            "end": (shift.start + shift.duration).isoformat(),
-            "title": str(shift),
+            "id": str(shift["id"]),
+            "start": shift["start"].isoformat(),
+            "end": shift["end"].isoformat(),
+            "title": f"{person} in {shift['location']} at {shift['start']}",
             "allDay": False,
-            "url": reverse("view_shift", args=(shift.id,)),
+            "url": f"{shift_url_prefix}{shift['id']}",
         }
-        for shift in target_users_shifts
+        for shift in shifts
     ]
-    target_users_shifts = json.dumps(target_users_shifts)
-    return render(
-        request,
-        "users/user_profile.html",
-        {"target_user": target_user, "target_users_shifts": target_users_shifts},
-    )
+    for occurrence in occurrences:
+        events.append(
+            {
+                "id": f"{occurrence.recurring_shift.id}:{occurrence.date}",
+                "start": occurrence.start.isoformat(),
+                "end": occurrence.end.isoformat(),
+                "title": f"{person} in {occurrence.location} at {occurrence.start}",
+                "allDay": False,
+                "url": reverse("view_occurrence", args=(occurrence.recurring_shift.id, occurrence.date.isoformat())),
+            }
+        )
+    return events
+
+
+@async_login_required
+async def user_shift_events(request: HttpRequest, user_id: int) -> HttpResponse:
+    """
+    A FullCalendar JSON event feed of a user's shifts, including occurrences of their recurring shifts, that overlap the
+    range given by the start and end parameters.
+    """
+
+    # Django's condition decorator doesn't support async views before Django 5.0, so this does what it would.
+    etag = quote_etag(await sync_to_async(_shift_events_etag)(request, user_id))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        range_start = _parse_event_range_bound(request.GET.get("start"))
+        range_end = _parse_event_range_bound(request.GET.get("end"))
+        if range_start is None or range_end is None or range_start >= range_end:
+            return HttpResponseBadRequest("start and end must be ISO 8601 dates, with start before end.")
+        if range_end - range_start > MAX_EVENT_RANGE:
+            return HttpResponseBadRequest(f"start and end can be at most {MAX_EVENT_RANGE.days} days apart.")
+        try:
+            target_user = await User.objects.aget(id=user_id)
+        except User.DoesNotExist:
+            raise Http404
+        shifts = [
+            shift
+            async for shift in Shift.objects.overlapping(range_start, range_end)
+            .filter(associated_person=target_user)
+            .order_by("start")
+            .values("id", "start", "end", "location")
+        ]
+        occurrences = await sync_to_async(expand)(
+            recurring_shifts_between(range_start, range_end).filter(associated_person=target_user),
+            range_start,
+            range_end,
+        )
+        # Events are only fetched a month or so at a time, so they're sent in one piece.
+        response = JsonResponse(_shift_events(shifts, occurrences, str(target_user)), safe=False)
+    response["ETag"] = etag
+    # Browsers should always check back, but can reuse what they have if the ETag still matches.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@restrict_to_http_methods("GET", "HEAD")
+def user_calendar_feed(request: HttpRequest, token: str) -> HttpResponse:
+    """
+    An iCalendar feed of the shifts of the user that token was made for, for calendar apps to subscribe to. It doesn't
+    need a login, since the token can't be guessed, but it stops working when the user gets a new feed address or is
+    deactivated. When the feed hasn't changed, this is usually answered without any queries.
+    """
+
+    token_contents = read_feed_token(token)
+    if token_contents is None:
+        raise Http404
+    user_id, feed_version = token_contents
+    owner = get_feed_owner(user_id)
+    if owner is None or owner[0] != feed_version:
+        raise Http404
+    name = owner[1]
+    today = timezone.localdate()
+    etag, last_modified = feed_validators(user_id, name, today)
+    etag = quote_etag(etag)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        origin = request.build_absolute_uri("/").removesuffix("/")
+        response = StreamingHttpResponse(stream_feed(user_id, name, today, origin), content_type="text/calendar")
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 
 @login_required
@@ -151,35 +365,65 @@ def create_user(request):
 @restrict_to_groups("Office staff", "Supervisors")
 def create_users_in_bulk(request):
     if request.method == "POST":
-        form = CreateUsersInBulkForm(request.POST)
+        form = CreateUsersInBulkForm(request.POST, request.FILES)
         if not form.is_valid():
             messages.add_message(request, messages.ERROR, f"Form errors: {form.errors}")
             return redirect("create_users_in_bulk")
-        user_data = form.cleaned_data["user_data"]
-        user_data = user_data.split("\n")
-        user_data = [s.strip() for s in user_data]
-        user_data = [s.split(",") for s in user_data]
-        for username, email, first_name, last_name, primary_group, password in user_data:
-            user = LRCDatabaseUser.objects.create_user(
-                username=username, email=email, first_name=first_name, last_name=last_name, password=password
-            )
-            Group.objects.filter(name=primary_group).first().user_set.add(user)
+        result = import_users(form.get_lines(), max_rows=MAX_WEB_IMPORT_ROWS)
+        if result.errors:
+            messages.add_message(request, messages.ERROR, "No users were created because some rows have problems.")
+            form = CreateUsersInBulkForm(initial={"user_data": form.cleaned_data["user_data"]})
+            return render(request, "users/create_users_in_bulk.html", {"form": form, "errors": result.errors})
+        messages.add_message(request, messages.SUCCESS, f"Created {result.created_count} users.")
         return HttpResponseRedirect(reverse("index"))
     else:
         form = CreateUsersInBulkForm()
         return render(request, "users/create_users_in_bulk.html", {"form": form})
 
 
+def render_page(request: HttpRequest, template_name: str, rows_template_name: str, context: Dict[str, Any]):
+    """
+    Renders a page of a paginated list. When the request asks for a fragment, as the infinite scrolling script does,
+    only the rows are rendered.
+    """
+
+    if request.GET.get("fragment"):
+        template_name = rows_template_name
+    return render(request, template_name, context)
+
+
+@restrict_to_groups("Office staff", "Supervisors")
+@restrict_to_http_methods("GET")
+def search(request: HttpRequest) -> HttpResponse:
+    """
+    Finds users, courses and hardware whose names (or usernames or email addresses) start with the words of the q
+    parameter. The search box in the navbar asks for just the results as the user types.
+    """
+
+    query = request.GET.get("q", "").strip()
+    results = search_index(query, ("user", "course", "hardware"), limit=SEARCH_RESULT_COUNT)
+    if request.GET.get("fragment"):
+        return render(request, "search/search_results.html", {"results": results})
+    return render(request, "search/search.html", {"query": query, "results": results})
+
+
 @restrict_to_groups("Office staff", "Supervisors")
 def list_users(request: HttpRequest, group: str) -> HttpResponse:
-    users = get_list_or_404(User.objects.order_by("last_name"), groups__name=group)
-    return render(request, "users/list_users.html", {"users": users, "group": group})
+    page = paginate(request, User.objects.filter(groups__name=group), ("last_name", "id"))
+    if not page.items and not Group.objects.filter(name=group).exists():
+        raise Http404
+    return render_page(
+        request,
+        "users/list_users.html",
+        "users/user_rows.html",
+        {"users": page.items, "next_cursor": page.next_cursor, "group": group},
+    )
 
 
 @login_required
 def view_shift(request, shift_id):
-    shift = get_object_or_404(Shift, pk=shift_id)
-    change_requests = ShiftChangeRequest.objects.filter(target=shift)
+    shift = get_object_or_404(Shift.objects.select_related("associated_person"), pk=shift_id)
+    change_requests = ShiftChangeRequest.objects.filter(target=shift).select_related(*CHANGE_REQUEST_TABLE_RELATED)
     return render(
         request,
         "shifts/view_shift.html",
@@ -187,6 +431,92 @@ def view_shift(request, shift_id):
     )
 
 
+def _get_occurrence(recurring_shift_id: int, date: str) -> Occurrence:
+    """
+    Returns the occurrence of a recurring shift on date, raising Http404 if there isn't one (including if it was
+    cancelled). Occurrences that have been materialized aren't returned either, but redirected to by the caller.
+    """
+
+    recurring_shift = get_object_or_404(
+        RecurringShift.objects.select_related("associated_person"), pk=recurring_shift_id
+    )
+    occurrence_date = parse_date(date)
+    if occurrence_date is None or not is_occurrence_date(recurring_shift, occurrence_date):
+        raise Http404
+    return Occurrence(recurring_shift, occurrence_date, occurrence_start(recurring_shift, occurrence_date))
+
+
+def _materialized_shift(occurrence: Occurrence) -> Optional[Shift]:
+    shift = Shift.objects.filter(recurrence=occurrence.recurring_shift, occurrence_date=occurrence.date).first()
+    if shift is None and occurrence.recurring_shift.exceptions.filter(date=occurrence.date).exists():
+        # The occurrence was cancelled.
+        raise Http404
+    return shift
+
+
+@login_required
+@restrict_to_http_methods("GET")
+def view_occurrence(request: HttpRequest, recurring_shift_id: int, date: str) -> HttpResponse:
+    """
+    Shows one occurrence of a recurring shift, or the Shift that it was materialized into.
+    """
+
+    occurrence = _get_occurrence(recurring_shift_id, date)
+    shift = _materialized_shift(occurrence)
+    if shift is not None:
+        return redirect("view_shift", shift.id)
+    return render(request, "shifts/view_occurrence.html", {"occurrence": occurrence})
+
+
+def _save_change_request(request: HttpRequest, form: NewChangeRequestForm, shift: Shift) -> None:
+    change_request = ShiftChangeRequest(
+        target=shift, approved=False, approved_by=None, approved_on=None, **form.cleaned_data
+    )
+    change_request.save()
+    conflicts = find_change_request_conflicts(change_request)
+    if conflicts:
+        messages.add_message(
+            request,
+            messages.WARNING,
+            "If it's approved, this change will conflict with: " + "; ".join(map(str, conflicts)),
+        )
+
+
+@login_required
+@restrict_to_http_methods("GET", "POST")
+def new_occurrence_change_request(request: HttpRequest, recurring_shift_id: int, date: str) -> HttpResponse:
+    """
+    Requests a change to one occurrence of a recurring shift. The occurrence is only materialized into a Shift of its
+    own when the request is submitted, in the same transaction that saves the request, so looking at the form and
+    leaving doesn't create anything.
+    """
+
+    occurrence = _get_occurrence(recurring_shift_id, date)
+    shift = _materialized_shift(occurrence)
+    if shift is not None:
+        return redirect("new_shift_change_request", shift.id)
+    if occurrence.recurring_shift.associated_person_id != request.user.id:
+        # TODO: let privileged users edit anyone's shifts
+        raise PermissionDenied
+    if request.method == "POST":
+        form = NewChangeRequestForm(request.POST)
+        if form.is_valid():
+            with transaction.atomic():
+                shift = materialize(occurrence.recurring_shift, occurrence.date)
+                _save_change_request(request, form, shift)
+            return redirect("view_shift", shift.id)
+    else:
+        form = NewChangeRequestForm(
+            initial={
+                "new_associated_person": occurrence.recurring_shift.associated_person,
+                "new_start": occurrence.start,
+                "new_duration": occurrence.duration,
+                "new_location": occurrence.location,
+            }
+        )
+    return render(request, "shifts/new_shift_change_request.html", {"form": form})
+
+
 @login_required
 def new_shift_change_request(request, shift_id):
     shift = get_object_or_404(Shift, pk=shift_id)
@@ -196,10 +526,7 @@ def new_shift_change_request(request, shift_id):
     if request.method == "POST":
         form = NewChangeRequestForm(request.POST)
         if form.is_valid():
-            s = ShiftChangeRequest(
-                target=shift, approved=False, approved_by=None, approved_on=None, **form.cleaned_data
-            )
-            s.save()
+            _save_change_request(request, form, shift)
             return HttpResponseRedirect(reverse("view_shift", args=(shift_id,)))
     else:
         form = NewChangeRequestForm(
@@ -217,24 +544,40 @@ def new_shift_change_request(request, shift_id):
         )
 
 
-@login_required
-def list_courses(request):
-    courses = Course.objects.order_by("department", "number")
-    return render(request, "courses/list_courses.html", {"courses": courses})
+@async_login_required
+async def list_courses(request):
+    page = await apaginate(request, Course.objects.all(), ("department", "number", "id"))
+    return await sync_to_async(render_page)(
+        request,
+        "courses/list_courses.html",
+        "courses/course_rows.html",
+        {"courses": page.items, "next_cursor": page.next_cursor},
+    )
 
 
-@login_required
-def view_course(request, course_id):
-    course = get_object_or_404(Course, id=course_id)
-    tutors = User.objects.filter(courses_tutored__in=(course,))
-    sis = User.objects.filter(si_course=course)
-    return render(
+@async_login_required
+async def view_course(request, course_id):
+    try:
+        course = await Course.objects.aget(id=course_id)
+    except Course.DoesNotExist:
+        raise Http404
+    tutors = [tutor async for tutor in User.objects.filter(courses_tutored__in=(course,))]
+    sis = [si async for si in User.objects.filter(si_course=course)]
+    return await sync_to_async(render)(
         request,
         "courses/view_course.html",
         {"course": course, "tutors": tutors, "sis": sis},
     )
 
 
+@login_required
+def course_coverage(request: HttpRequest) -> HttpResponse:
+    week_start, _, _ = current_week()
+    return render(
+        request, "courses/course_coverage.html", {"coverage": get_course_coverage(), "week_start": week_start}
+    )
+
+
 @restrict_to_groups("Office staff", "Supervisors")
 def add_course(request):
     if request.method == "POST":
@@ -271,31 +614,94 @@ def edit_course(request, course_id):
 
 
 @restrict_to_groups("Office staff", "Supervisors")
-def view_shift_change_requests(request, kind):
-    requests = get_list_or_404(ShiftChangeRequest, target__kind=kind, approved=False)
-    return render(
+async def view_shift_change_requests(request, kind):
+    if kind not in ("SI", "Tutoring"):
+        raise Http404
+    requests = ShiftChangeRequest.objects.filter(target__kind=kind, approved=False).select_related(
+        *CHANGE_REQUEST_TABLE_RELATED
+    )
+    page = await apaginate(request, requests, ("id",))
+    return await sync_to_async(render_page)(
         request,
         "scheduling/view_shift_change_requests.html",
-        {"change_requests": requests, "kind": kind},
+        "includes/shift_change_request_rows.html",
+        {"change_requests": page.items, "next_cursor": page.next_cursor, "kind": kind, "selectable": True},
     )
 
 
+@restrict_to_groups("Office staff", "Supervisors")
+@restrict_to_http_methods("POST")
+def approve_shift_change_requests(request: HttpRequest, kind: str) -> HttpResponse:
+    if kind not in ("SI", "Tutoring"):
+        raise Http404
+    try:
+        request_ids = [int(request_id) for request_id in request.POST.getlist("request_ids")]
+    except ValueError:
+        return HttpResponseBadRequest("request_ids must be integers.")
+    result = approve_change_requests(request_ids, request.user)
+    messages.add_message(request, messages.SUCCESS, f"Approved {len(result.approved_ids)} change requests.")
+    if result.skipped_ids:
+        messages.add_message(
+            request,
+            messages.WARNING,
+            "These change requests weren't approved, because an earlier request for the same shift was. Please look "
+            "at them again: " + "; ".join(result.skipped),
+        )
+    if result.conflicts:
+        messages.add_message(
+            request, messages.WARNING, "The approved changes caused conflicts: " + "; ".join(result.conflicts)
+        )
+    return redirect("view_shift_change_requests", kind)
+
+
+@restrict_to_groups("Office staff", "Supervisors")
+@restrict_to_http_methods("GET")
+def payroll_report(request: HttpRequest) -> HttpResponse:
+    """
+    Shows how long each person worked in each period, or exports it as a CSV or JSON file. Exports are streamed, so
+    they take the same amount of memory however long they are. Django reads a whole synchronous iterator before an
+    ASGI server can send any of it, so under ASGI the export is made in batches by an asynchronous iterator instead.
+    """
+
+    form = PayrollForm(request.GET or None)
+    if not form.is_valid():
+        return render(request, "payroll/payroll_report.html", {"form": form})
+    first_date = form.cleaned_data["first_date"]
+    last_date = form.cleaned_data["last_date"]
+    rows = hours_worked(first_date, last_date, form.cleaned_data["period"])
+    export_format = form.cleaned_data["format"]
+    if export_format == "html":
+        return render(request, "payroll/payroll_report.html", {"form": form, "rows": rows})
+    chunks = to_csv(rows) if export_format == "csv" else to_json(rows)
+    if isinstance(request, ASGIRequest):
+        chunks = stream_async(chunks)
+    response = StreamingHttpResponse(chunks, content_type="text/csv" if export_format == "csv" else "application/json")
+    response["Content-Disposition"] = f'attachment; filename="hours-{first_date}-{last_date}.{export_format}"'
+    return response
+
+
 @restrict_to_groups("Office staff", "Supervisors")
 def show_hardware(request):
-    hardware = Hardware.objects.order_by("name")
-    curLoans = Loan.objects.all()
-    return render(
+    hardware = Hardware.objects.with_availability()
+    page = paginate(request, hardware, ("name", "id"))
+    return render_page(
         request,
         "hardware/hardware_table.html",
-        {"hardware": hardware, "curLoans": curLoans},
+        "hardware/hardware_rows.html",
+        {"hardware": page.items, "next_cursor": page.next_cursor},
     )
 
 
 @restrict_to_groups("Office staff", "Supervisors")
 def show_loans(request):
-    loanInfo = Loan.objects.order_by("return_time")
-
-    return render(request, "loans/show_loans.html", {"loanInfo": loanInfo})
+    loanInfo = Loan.objects.select_related("target", "hardware_user")
+    page = paginate(request, loanInfo, ("return_time", "id"))
+    return render_page(
+        request,
+        "loans/show_loans.html",
+        "loans/loan_rows.html",
+        {"loanInfo": page.items, "next_cursor": page.next_cursor},
+    )
 
 
 @restrict_to_groups("Office staff", "Supervisors")
@@ -305,21 +711,35 @@ def add_hardware(request):
         if form.is_valid():
             instance = form.save(commit=False)
             instance.save()
-        return HttpResponseRedirect(reverse("show_hardware"))
+        return HttpResponseRedirect(reverse("showHardware"))
     else:
         form = AddHardwareForm()
         context = {"form": form}
     return render(request, "hardware/add_hardware.html", context)
 
 
+def save_loan(form: NewLoanForm) -> bool:
+    """
+    Saves a valid loan form, returning whether it worked. The form checks that the item isn't already on loan, but
+    someone else could lend it out between that check and the save, in which case the database's constraint stops the
+    save and the error is added to the form instead.
+    """
+
+    try:
+        with transaction.atomic():
+            form.save()
+    except IntegrityError:
+        form.add_error("target", "This item is already on loan.")
+        return False
+    return True
+
+
 @restrict_to_groups("Office staff", "Supervisors")
 def add_loans(request):
     if request.method == "POST":
         form = NewLoanForm(request.POST)
-        if form.is_valid():
-            instance = form.save(commit=False)
-            instance.save()
-            return HttpResponseRedirect(reverse("show_loans"))
+        if form.is_valid() and save_loan(form):
+            return HttpResponseRedirect(reverse("showLoans"))
     else:
         form = NewLoanForm()
     context = {"form": form}
@@ -331,15 +751,26 @@ def edit_loans(request, loan_id):
     loan1 = Loan.objects.get(id=loan_id)
     if request.method == "POST":
         form = NewLoanForm(request.POST, instance=loan1)
-        if form.is_valid():
-            form.save()
-            return redirect("show_loans")
+        if form.is_valid() and save_loan(form):
+            return redirect("showLoans")
     else:
         form = NewLoanForm(instance=loan1)
 
     return render(request, "loans/edit_loans.html", {"form": form, "loan_id": loan_id})
 
 
+@restrict_to_groups("Office staff", "Supervisors")
+@restrict_to_http_methods("POST")
+def return_loan(request, loan_id):
+    # A single UPDATE, so the loan can't be returned twice, even by two people at once.
+    returned = Loan.objects.filter(id=loan_id, return_time__isnull=True).update(return_time=timezone.now())
+    if returned:
+        messages.add_message(request, messages.SUCCESS, "Loan returned.")
+    else:
+        messages.add_message(request, messages.ERROR, "That loan has already been returned.")
+    return redirect("showLoans")
+
+
 @restrict_to_groups("Office staff", "Supervisors")
 def edit_hardware(request, hardware_id):
     hardware1 = Hardware.objects.get(id=hardware_id)
@@ -348,7 +779,7 @@ def edit_hardware(request, hardware_id):
         if form.is_valid():
             instance = form.save(commit=False)
             instance.save()
-            return redirect("show_hardware")
+            return redirect("showHardware")
     else:
         form = AddHardwareForm(instance=hardware1)
     context = {"form": form, "hardware_id": hardware_id}
@@ -1,14 +1,208 @@
+import datetime
+import hashlib
+from typing import Any, Dict, List, Optional, Set, Tuple, Type
+
 from django import forms
 from django.contrib import messages
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Model, QuerySet
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import redirect, render
+from django.utils import timezone
 
-from ..models import Shift
+from ..alerts import invalidate_alert_counts
+from ..coverage import refresh_tutoring_coverage
+from ..models import Shift, ShiftChangeRequest
+from ..recurrence import Occurrence, cancel, expand, recurring_shifts_between
+from ..schedules import invalidate_schedules
 from . import restrict_to_groups, restrict_to_http_methods
 
+# How many shifts are deleted per transaction. Keeping transactions small means that other requests never have to wait
+# long for the database, even when a whole week of shifts is being dropped.
+DROP_CHUNK_SIZE = 500
+
+# How many of the affected shifts are listed when asking for confirmation.
+DROP_PREVIEW_LIMIT = 100
+
+# How long (in seconds) someone has to confirm dropping shifts after seeing which ones would be dropped.
+DROP_TOKEN_MAX_AGE = 60 * 60
+
+DROP_TOKEN_SALT = "main.drop_shifts"
+
 
 class DropShiftsOnDateForm(forms.Form):
-    date = forms.DateField()
+    date = forms.DateField(help_text="The first day to drop shifts on.")
+    end_date = forms.DateField(
+        required=False,
+        help_text="The last day to drop shifts on. Leave this blank to only drop shifts on the first day.",
+    )
+    kind = forms.ChoiceField(
+        required=False,
+        choices=(("", "Any"),) + Shift._meta.get_field("kind").choices,  # type: ignore
+        help_text="Only drop shifts of this kind.",
+    )
+    location = forms.CharField(
+        required=False,
+        max_length=32,
+        help_text="Only drop shifts in this location, e.g. GSMN 64.",
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date = cleaned_data.get("date")
+        end_date = cleaned_data.get("end_date")
+        if date and end_date and end_date < date:
+            raise ValidationError("The last day can't be before the first day.")
+        return cleaned_data
+
+
+def get_drop_criteria(form: DropShiftsOnDateForm) -> Dict[str, Any]:
+    """
+    Turns a valid form into criteria that can be put in a drop token and passed to get_shifts_to_drop().
+    """
+
+    date = form.cleaned_data["date"]
+    end_date = form.cleaned_data["end_date"] or date
+    return {
+        "date": date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "kind": form.cleaned_data["kind"],
+        "location": form.cleaned_data["location"],
+    }
+
+
+def get_drop_range(criteria: Dict[str, Any]) -> Tuple[datetime.datetime, datetime.datetime]:
+    """
+    Returns the half-open range of start times covering the days from criteria["date"] through criteria["end_date"] in
+    the current time zone.
+    """
+
+    first_day = datetime.date.fromisoformat(criteria["date"])
+    last_day = datetime.date.fromisoformat(criteria["end_date"])
+    range_start = timezone.make_aware(datetime.datetime.combine(first_day, datetime.time()))
+    range_end = timezone.make_aware(datetime.datetime.combine(last_day + datetime.timedelta(days=1), datetime.time()))
+    return range_start, range_end
+
+
+def get_shifts_to_drop(criteria: Dict[str, Any]) -> QuerySet[Shift]:
+    """
+    Returns the shifts that start on any of the days from criteria["date"] through criteria["end_date"]. The days are
+    turned into a range of start times so that the index on Shift.start can be used.
+    """
+
+    range_start, range_end = get_drop_range(criteria)
+    shifts = Shift.objects.filter(start__gte=range_start, start__lt=range_end)
+    if criteria["kind"]:
+        shifts = shifts.filter(kind=criteria["kind"])
+    if criteria["location"]:
+        shifts = shifts.filter(location=criteria["location"])
+    return shifts
+
+
+def get_occurrences_to_drop(criteria: Dict[str, Any]) -> List[Occurrence]:
+    """
+    Returns the occurrences of recurring shifts that start on any of the days from criteria["date"] through
+    criteria["end_date"].
+    """
+
+    range_start, range_end = get_drop_range(criteria)
+    recurring_shifts = recurring_shifts_between(range_start, range_end).select_related("associated_person")
+    if criteria["kind"]:
+        recurring_shifts = recurring_shifts.filter(kind=criteria["kind"])
+    if criteria["location"]:
+        recurring_shifts = recurring_shifts.filter(location=criteria["location"])
+    occurrences = expand(recurring_shifts, range_start, range_end)
+    return [occurrence for occurrence in occurrences if occurrence.start >= range_start]
+
+
+def get_drop_checksum(shifts: QuerySet[Shift], occurrences: List[Occurrence]) -> str:
+    """
+    Returns a short hash of which shifts and occurrences would be dropped, so that confirming can tell whether they're
+    still the same ones, and not just the same number of them. Only the IDs are fetched.
+    """
+
+    digest = hashlib.sha256()
+    for shift_id in shifts.order_by("id").values_list("id", flat=True).iterator():
+        digest.update(f"{shift_id},".encode())
+    for occurrence in occurrences:
+        digest.update(f"{occurrence.recurring_shift.id}:{occurrence.date},".encode())
+    return digest.hexdigest()[:16]
+
+
+def make_drop_token(user_id: int, criteria: Dict[str, Any], count: int, checksum: str) -> str:
+    """
+    Returns a signed token describing a drop that user_id has previewed, to be sent back when they confirm it. It holds
+    the criteria rather than the IDs of the shifts, so it stays small however many shifts there are, and it's carried
+    by the confirmation form instead of the session.
+    """
+
+    return signing.dumps(
+        {"user": user_id, "criteria": criteria, "count": count, "checksum": checksum},
+        salt=DROP_TOKEN_SALT,
+        compress=True,
+    )
+
+
+def read_drop_token(user_id: int, token: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns what make_drop_token() put in token, or None if it was tampered with, has expired, or was made for someone
+    else.
+    """
+
+    try:
+        pending_drop = signing.loads(token, salt=DROP_TOKEN_SALT, max_age=DROP_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    if pending_drop["user"] != user_id:
+        return None
+    return pending_drop
+
+
+def _delete_rows(model: Type[Model], column: str, values: List[int]) -> int:
+    """
+    Deletes the rows of model's table whose column is one of values with a single DELETE, without loading them or
+    sending signals, and returns how many were deleted.
+    """
+
+    placeholders = ", ".join(["%s"] * len(values))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            # The table and column names come from the models, and the values are passed as parameters.
+            f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)} "  # nosec
+            f"WHERE {connection.ops.quote_name(column)} IN ({placeholders})",
+            values,
+        )
+        return cursor.rowcount
+
+
+def delete_shifts_in_chunks(shifts: QuerySet[Shift]) -> int:
+    """
+    Deletes shifts (and the change requests that target them) DROP_CHUNK_SIZE at a time, each chunk in its own
+    transaction, and returns how many shifts were deleted.
+
+    The rows are deleted directly rather than through Model.delete(), which would load every shift and change request
+    and send signals for each of them, so what those signals would update (caches and course coverage) is updated
+    here instead.
+    """
+
+    deleted_count = 0
+    person_ids: Set[int] = set()
+    while True:
+        with transaction.atomic():
+            chunk = list(shifts.order_by("id").values_list("id", "associated_person_id")[:DROP_CHUNK_SIZE])
+            if not chunk:
+                break
+            shift_ids = [shift_id for shift_id, _ in chunk]
+            _delete_rows(ShiftChangeRequest, "target_id", shift_ids)
+            deleted_count += _delete_rows(Shift, "id", shift_ids)
+        chunk_person_ids = {person_id for _, person_id in chunk}
+        invalidate_schedules(chunk_person_ids)
+        person_ids |= chunk_person_ids
+    invalidate_alert_counts()
+    refresh_tutoring_coverage(person_ids)
+    return deleted_count
 
 
 @restrict_to_groups("Office staff", "Supervisors")
@@ -19,20 +213,56 @@ def drop_shifts_on_date(request: HttpRequest) -> HttpResponse:
 
 
 @restrict_to_groups("Office staff", "Supervisors")
-@restrict_to_http_methods("GET", "POST")
+@restrict_to_http_methods("POST")
 def drop_shifts_on_date_confirmation(request: HttpRequest) -> HttpResponse:
-    if request.method == "POST":
+    """
+    Shows which shifts would be dropped when the form from drop_shifts_on_date is posted, and drops them when the
+    token from that page is posted back.
+    """
+
+    if "token" not in request.POST:
         form = DropShiftsOnDateForm(request.POST)
         if not form.is_valid():
             messages.add_message(request, messages.ERROR, f"Form has errors: {form.errors}")
             return redirect("drop_shifts_on_date")
-        date = form.cleaned_data["date"]
-        shifts = Shift.objects.filter(start__year=date.year, start__month=date.month, start__day=date.day)
-        request.session["shift_keys"] = list(shifts.values_list("id", flat=True))
-        return render(request, "shifts/drop_shifts_on_date_confirmation.html", {"affected_shifts": shifts})
+        criteria = get_drop_criteria(form)
+        shifts = get_shifts_to_drop(criteria)
+        occurrences = get_occurrences_to_drop(criteria)
+        affected_count = shifts.count() + len(occurrences)
+        token = make_drop_token(request.user.id, criteria, affected_count, get_drop_checksum(shifts, occurrences))
+        affected_shifts: List[Any] = list(
+            shifts.select_related("associated_person").order_by("start")[:DROP_PREVIEW_LIMIT]
+        )
+        affected_shifts += occurrences[: DROP_PREVIEW_LIMIT - len(affected_shifts)]
+        return render(
+            request,
+            "shifts/drop_shifts_on_date_confirmation.html",
+            {
+                "affected_shifts": affected_shifts,
+                "affected_count": affected_count,
+                "unlisted_count": affected_count - len(affected_shifts),
+                "token": token,
+            },
+        )
     else:
-        shift_keys = request.session.get("shift_keys", [])
-        shifts = Shift.objects.filter(id__in=shift_keys)
-        deleted_count, _ = shifts.delete()
+        pending_drop = read_drop_token(request.user.id, request.POST["token"])
+        if pending_drop is None:
+            messages.add_message(
+                request, messages.ERROR, "This confirmation has expired, so nothing was deleted. Please try again."
+            )
+            return redirect("drop_shifts_on_date")
+        shifts = get_shifts_to_drop(pending_drop["criteria"])
+        occurrences = get_occurrences_to_drop(pending_drop["criteria"])
+        if (
+            shifts.count() + len(occurrences) != pending_drop["count"]
+            or get_drop_checksum(shifts, occurrences) != pending_drop["checksum"]
+        ):
+            messages.add_message(
+                request,
+                messages.ERROR,
+                "Shifts were added or removed since you reviewed them, so nothing was deleted. Please try again.",
+            )
+            return redirect("drop_shifts_on_date")
+        deleted_count = delete_shifts_in_chunks(shifts) + cancel(occurrences)
         messages.add_message(request, messages.INFO, f"Deleted {deleted_count} shifts.")
         return redirect("drop_shifts_on_date")